@@ -9,38 +9,473 @@ import urllib
 import sys
 import getopt
 import time
-import collections
+import collections.abc
 import json
-import requests
 import posixpath
 import threading
+import multiprocessing
+import signal
+import bisect
+import io
+import heapq
+import itertools
+import random
+import hashlib
+import re
+import zlib
+import email.utils
 
 import os
 import ssl
+from concurrent.futures import ThreadPoolExecutor
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse, urlunparse, parse_qs
+from urllib.parse import urlparse, urlunparse, parse_qs, quote
 from rfSsdpServer import RfSDDPServer
-
-patchedLinks = dict()
+from rfEventDispatcher import RfEventDispatcher
+from rfMockupMetrics import RfMockupMetrics
+from rfMockupLog import RfMockupLog, logger, access_logger, levels
+from rfMockupStore import RfMutationStore, RfStoreManager, RfStoreFull
+from rfMockupAsync import serve_asyncio
+from rfMockupQuery import RfFilter, RfQueryError, parse_select, select_properties, lookup
+from rfMockupPack import RfPackedMockup, is_packed_mockup
 
 tool_version = "1.0.6"
 
 dont_send = ["connection", "keep-alive", "content-length", "transfer-encoding"]
 
+# -E: hard coded etags by request path, and their header lines
+test_etags = {"/redfish/v1/Systems/1": 'W/"12345"',
+              "/redfish/v1/AccountService/Accounts/1": '"123456"'}
+test_etag_lines = {path: 'Etag: {}\r\n'.format(etag).encode() for path, etag in test_etags.items()}
 
-def get_cached_link(path):
-    if path not in patchedLinks:
-        if os.path.isfile(path):
-            with open(path) as f:
-                jsonData = json.load(f)
-                f.close()
-        else:
-            jsonData = None
+# reserved paths answered to local clients only: --metrics, and POST to drop all PATCH/POST/DELETE changes
+metrics_path = '/mockup/metrics'
+reset_path = '/mockup/reset'
+
+# -s: seconds a new https connection has to complete its TLS handshake
+handshake_timeout = 10
+
+
+# -D of a packed mockup (rfMockupPack.py): real path of the pack: RfPackedMockup
+packed_mockups = dict()
+
+
+def find_pack(path):
+    """
+    The packed mockup a path is in, and the name of the file within it
+    :return: (RfPackedMockup, name), or (None, None) for a path of a mockup directory
+    """
+    for packPath, pack in packed_mockups.items():
+        if path.startswith(packPath + os.sep):
+            return pack, path[len(packPath) + 1:].replace(os.sep, '/')
+    return None, None
+
+
+def mockup_isfile(path):
+    pack, name = find_pack(path) if packed_mockups else (None, None)
+    return pack.isfile(name) if pack is not None else os.path.isfile(path)
+
+
+def open_mockup_file(path):
+    """
+    Open a file of a mockup directory or of a packed mockup for sending
+    :return: (binary file object, offset of the file in it, size, mtime in ns)
+    """
+    pack, name = find_pack(path) if packed_mockups else (None, None)
+    if pack is not None:
+        offset, size, mtime = pack.entry(name)
+        return open(pack.path, 'rb'), offset, size, mtime
+    f = open(path, 'rb')
+    st = os.fstat(f.fileno())
+    return f, 0, st.st_size, st.st_mtime_ns
+
+
+def load_json_file(path):
+    if packed_mockups:
+        pack, name = find_pack(path)
+        if pack is not None:
+            data = pack.read(name)
+            return parse_json(data) if data is not None else None
+    if not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def parse_json(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def parse_resource(data):
+    return MemberCollection.from_payload(parse_json(data))
+
+
+class MemberChanges(object):
+        '''
+        Members added to and removed from a collection, shared by the copies of a MemberCollection
+        made one after the other.  Each change is logged with how to undo it, so a copy that is read
+        after a later copy changed the members takes those changes back in a copy of its own.
+        '''
+        def __init__(self, removed=(), added=()):
+            self.removed = list(removed)    # sorted base positions deleted
+            self.added = list(added)        # ids of members added, in order
+            self.addedIds = set(self.added)
+            self.log = []                   # ('add',), ('remove', position) or ('drop', index, id) per change
+            self.lock = threading.Lock()
+
+        def __reduce__(self):
+            return (MemberChanges, (self.removed, self.added))
+
+        def undone(self, version):
+            """
+            Copy of the changes as they were after the first version changes of the log, with an empty log
+            """
+            with self.lock:
+                other = MemberChanges(self.removed, self.added)
+                log = self.log[version:]
+            for entry in reversed(log):
+                if entry[0] == 'add':
+                    other.addedIds.discard(other.added.pop())
+                elif entry[0] == 'remove':
+                    del other.removed[bisect.bisect_left(other.removed, entry[1])]
+                else:
+                    other.added.insert(entry[1], entry[2])
+                    other.addedIds.add(entry[2])
+            return other
+
+
+class MemberCollection(object):
+        '''
+        Members of a collection: a base list of members, or a range of generated @odata.id values,
+        plus the members added and removed since.  Membership checks, id allocation, copies and
+        changes are O(1) and pages are built on demand, so a collection costs memory only for the
+        page served.
+        '''
+        def __init__(self, members=(), template=None, start=1, count=0, member=None):
+            """__init__
+
+            :param members: base Members list, @odata.id strings or member dicts
+            :param template: '{}' pattern of generated member ids, used instead of members
+            :param start: first number of the generated members
+            :param count: number of generated members
+            :param member: payload of the generated members, '{Id}' in its strings is replaced by the number
+            """
+            # plain {'@odata.id': ...} members are kept as their id string
+            self.base = tuple(m['@odata.id'] if isinstance(m, dict) and len(m) == 1 and '@odata.id' in m else m
+                              for m in members)
+            self.template = template
+            self.start = start
+            self.count = count if template is not None else len(self.base)
+            self.memberText = json.dumps(member) if member is not None else None
+            self.changes = MemberChanges()  # members added and removed since, shared with copies
+            self.version = 0            # number of logged changes this collection sees
+            self.nextId = None          # where allocate continues searching
+            self.positions = None       # {id: base position}, built on first use
+            self.mockupBase = False     # base is the Members of the mockup file, left out of the state store journal
+            self.removedIds = None      # ids of the removed members read from the state store, until the base is known
+
+        @classmethod
+        def from_payload(cls, body):
+            """
+            Replace the Members list, or a Members@Mockup.Template annotation, of a parsed index.json
+            """
+            if not isinstance(body, dict):
+                return body
+            if 'Members@Mockup.Template' in body:
+                t = body.pop('Members@Mockup.Template')
+                body['Members'] = cls(template=t['Pattern'], start=t.get('Start', 1), count=t['Count'], member=t.get('Member'))
+                body['Members@odata.count'] = len(body['Members'])
+            elif isinstance(body.get('Members'), list):
+                body['Members'] = cls(body['Members'])
+                body['Members'].mockupBase = True
+            return body
+
+        def __getstate__(self):
+            state = dict(self.__dict__)
+            state['positions'] = None
+            state['changes'] = self.changes.undone(self.version)
+            state['version'] = 0
+            return state
+
+        def to_state(self):
+            """
+            json-ready state for the state store snapshot; base members read from the mockup are left out,
+            restore_state reads them again, so removed members are kept by id rather than by position
+            """
+            changes = self.view()
+            return {'base': None if self.mockupBase else list(self.base), 'template': self.template,
+                    'start': self.start, 'count': self.count, 'member': self.memberText,
+                    'removed': [self.member_id(self.base_member(pos)) for pos in changes.removed],
+                    'added': list(changes.added), 'nextId': self.nextId}
+
+        @classmethod
+        def from_state(cls, state):
+            other = cls(state['base'] or ())
+            other.mockupBase = state['base'] is None
+            other.template = state['template']
+            other.start = state['start']
+            other.count = state['count']
+            other.memberText = state['member']
+            other.changes = MemberChanges((), state['added'])
+            other.nextId = state['nextId']
+            other.removedIds = state['removed']
+            if not other.mockupBase:
+                other.find_removed()
+            return other
+
+        def rebase(self, mockup):
+            """
+            Take the base members of the collection replayed from the journal, mockup, again
+            """
+            self.base = mockup.base
+            self.positions = None
+            if self.template is None:
+                self.count = len(self.base)
+            self.find_removed()
+
+        def find_removed(self):
+            """
+            Turn the ids of the removed members read from the state store into base positions
+            """
+            removed = set()
+            for member in self.removedIds or ():
+                # older journals kept positions
+                pos = member if isinstance(member, int) else self.base_position(member)
+                if pos is None or not 0 <= pos < self.count:
+                    logger.warning('State store: %s is no longer a member of the mockup, its DELETE is dropped', member)
+                else:
+                    removed.add(pos)
+            self.changes = MemberChanges(sorted(removed), self.view().added)
+            self.version = 0
+            self.removedIds = None
+
+        def view(self):
+            """
+            The changes as this collection sees them
+            """
+            changes = self.changes
+            if self.version != len(changes.log):
+                # a later copy changed the members since, take its changes back
+                changes = self.changes = changes.undone(self.version)
+                self.version = 0
+            return changes
+
+        def __len__(self):
+            changes = self.view()
+            return self.count - len(changes.removed) + len(changes.added)
+
+        def __iter__(self):
+            return iter(self.page())
+
+        def __repr__(self):
+            return '<MemberCollection of {}>'.format(len(self))
+
+        def member_id(self, member):
+            return member if not isinstance(member, dict) else member.get('@odata.id')
+
+        def base_position(self, odataId):
+            if self.template is not None:
+                prefix, _, suffix = self.template.partition('{}')
+                number = odataId[len(prefix):len(odataId) - len(suffix)]
+                if not (odataId.startswith(prefix) and odataId.endswith(suffix) and number.isdigit()):
+                    return None
+                pos = int(number) - self.start
+                return pos if 0 <= pos < self.count and str(int(number)) == number else None
+            if self.positions is None:
+                self.positions = {self.member_id(m): n for n, m in enumerate(self.base)}
+            return self.positions.get(odataId)
+
+        def is_removed(self, pos):
+            removed = self.view().removed
+            n = bisect.bisect_left(removed, pos)
+            return n < len(removed) and removed[n] == pos
+
+        def __contains__(self, odataId):
+            if odataId in self.view().addedIds:
+                return True
+            pos = self.base_position(odataId)
+            return pos is not None and not self.is_removed(pos)
+
+        def base_member(self, pos):
+            if self.template is not None:
+                return {'@odata.id': self.template.format(self.start + pos)}
+            m = self.base[pos]
+            return m if isinstance(m, dict) else {'@odata.id': m}
+
+        def page(self, skip=0, top=None):
+            """
+            Members list from position skip, at most top of them
+            """
+            skip = max(skip, 0)
+            out = []
+            changes = self.view()
+            removed = changes.removed
+            live = self.count - len(removed)
+            if skip < live:
+                # smallest base position with skip live positions before it
+                pos = skip
+                while True:
+                    nxt = skip + bisect.bisect_right(removed, pos)
+                    if nxt == pos:
+                        break
+                    pos = nxt
+                r = bisect.bisect_left(removed, pos)
+                while pos < self.count and (top is None or len(out) < top):
+                    if r < len(removed) and removed[r] == pos:
+                        r += 1
+                    else:
+                        out.append(self.base_member(pos))
+                    pos += 1
+            first = max(skip - live, 0)
+            last = None if top is None else first + top - len(out)
+            out.extend({'@odata.id': m} for m in changes.added[first:last])
+            return out
+
+        def copy(self):
+            """
+            Copy to modify, sharing the base members and the changes so far
+            """
+            other = MemberCollection.__new__(MemberCollection)
+            other.__dict__.update(self.__dict__)
+            return other
+
+        def change(self, undo, apply):
+            """
+            Make a change to the members this collection sees, logged with how to undo it
+            """
+            changes = self.view()
+            if len(changes.log) > 1024 and len(changes.log) > 2 * (len(changes.added) + len(changes.removed)):
+                # start a new log once it outgrows the members, copies made before keep the old one
+                changes = self.changes = changes.undone(self.version)
+            with changes.lock:
+                apply(changes)
+                changes.log.append(undo)
+                self.version = len(changes.log)
+
+        def allocate(self, prefix):
+            """
+            First n of an unused '<prefix><n>' id, counting from the collection size plus one
+            """
+            n = self.nextId or len(self) + 1
+            while '{}{}'.format(prefix, n) in self:
+                n = n + 1
+            return n
+
+        def add(self, odataId):
+            def apply(changes):
+                changes.added.append(odataId)
+                changes.addedIds.add(odataId)
+            self.change(('add',), apply)
+
+        def remove(self, odataId):
+            changes = self.view()
+            if odataId in changes.addedIds:
+                index = changes.added.index(odataId)
+
+                def apply(changes):
+                    changes.addedIds.discard(odataId)
+                    del changes.added[index]
+                self.change(('drop', index, odataId), apply)
+                return
+            pos = self.base_position(odataId)
+            if pos is not None and not self.is_removed(pos):
+                self.change(('remove', pos), lambda changes: bisect.insort(changes.removed, pos))
+
+        def member_payload(self, key):
+            """
+            Payload of generated member number key, None if it is not a live generated member
+            """
+            if self.memberText is None or not key.isdigit():
+                return None
+            pos = int(key) - self.start
+            if not 0 <= pos < self.count or self.is_removed(pos):
+                return None
+            return json.loads(self.memberText.replace('{Id}', key))
+
+
+def load_resource_file(path):
+    """
+    Parse an index.json, with its Members held in a MemberCollection
+    """
+    return MemberCollection.from_payload(load_json_file(path))
+
+
+def restore_state(path, value):
+    """
+    Give a collection replayed from the state store journal the base members of its mockup file
+    :param path: index.json path of the resource
+    :param value: replayed resource
+    :return: value
+    """
+    members = value.get('Members') if isinstance(value, dict) else None
+    if isinstance(members, MemberCollection) and members.mockupBase and members.template is None:
+        mockup = load_resource_file(path)
+        mockup = mockup.get('Members') if isinstance(mockup, dict) else None
+        members.rebase(mockup if isinstance(mockup, MemberCollection) else MemberCollection())
+        value['Members@odata.count'] = len(members)
+    return value
+
+
+def edit_members(value, edit):
+    """
+    Add or remove a member of a collection in the state store, which journals only the edit
+    :param value: collection payload, not changed
+    :param edit: {'add': id, 'nextId': n} or {'remove': id}
+    :return: the edited payload
+    """
+    if not isinstance(value, dict):
+        return value
+    members = value.get('Members')
+    members = members.copy() if isinstance(members, MemberCollection) else MemberCollection(members or ())
+    if 'add' in edit:
+        members.add(edit['add'])
+        members.nextId = edit.get('nextId', members.nextId)
     else:
-        jsonData = patchedLinks[path]
+        members.remove(edit['remove'])
+    value = dict(value)
+    value['Members'] = members
+    value['Members@odata.count'] = len(members)
+    return value
+
+
+def get_virtual_member(path, links, load=load_resource_file):
+    """
+    Payload of a member generated from its collection's Members@Mockup.Template
+    :param path: index.json path of the member
+    :param links: PATCH/POST/DELETE changes of the mockup, see MockupInstance
+    :param load: reads the collection's index.json when it is not in links
+    :return: payload, or None if there is no such generated member
+    """
+    parentpath = os.path.join(os.path.dirname(os.path.dirname(path)), 'index.json')
+    parent = links.get(parentpath)
+    if parent is None:
+        parent = load(parentpath)
+    if not isinstance(parent, dict) or not isinstance(parent.get('Members'), MemberCollection):
+        return None
+    return parent['Members'].member_payload(os.path.basename(os.path.dirname(path)))
+
+
+def get_cached_link(path, links):
+    jsonData = links.get(path)
+    if jsonData is None or isinstance(jsonData, ResourceOverlay):
+        base = load_resource_file(path)
+        if base is None:
+            base = get_virtual_member(path, links)
+        jsonData = jsonData.apply(base) if jsonData is not None else base
     return jsonData is not None and jsonData != '404', jsonData
 
 
+def stored_collection(path, links):
+    """
+    Look up a collection like get_cached_link
+    :return: (success, payload, True if links holds the whole payload, so that edit_members can change it there)
+    """
+    jsonData = links.get(path)
+    if isinstance(jsonData, dict):
+        return True, jsonData, True
+    return get_cached_link(path, links) + (False,)
+
+
 def dict_merge(dct, merge_dct):
         """
         https://gist.github.com/angstwad/bf22d1822c38a92ec0a9 modified
@@ -53,12 +488,78 @@ def dict_merge(dct, merge_dct):
         :return: None
         """
         for k in merge_dct:
-            if (k in dct and isinstance(dct[k], dict) and isinstance(merge_dct[k], collections.Mapping)):
+            if (k in dct and isinstance(dct[k], dict) and isinstance(merge_dct[k], collections.abc.Mapping)):
                 dict_merge(dct[k], merge_dct[k])
             else:
                 dct[k] = merge_dct[k]
 
 
+def merged(dct, merge_dct):
+    """
+    Merge like dict_merge, into a copy of dct; only the dicts along the merged keys are copied,
+    the rest is shared with dct and merge_dct, so neither may be changed in place afterwards
+    :param dct: dict to merge onto
+    :param merge_dct: dct merged into the copy
+    :return: the merged copy
+    """
+    out = dict(dct)
+    for k in merge_dct:
+        if k in out and isinstance(out[k], dict) and isinstance(merge_dct[k], collections.abc.Mapping):
+            out[k] = merged(out[k], merge_dct[k])
+        else:
+            out[k] = merge_dct[k]
+    return out
+
+
+class ResourceOverlay(object):
+        '''
+        PATCHed changes of a mockup resource, kept in the state store instead of a changed copy of
+        the whole resource and merged over the unchanged resource when it is read
+        '''
+        __slots__ = ('delta',)
+
+        def __init__(self, delta):
+            self.delta = delta
+
+        def __repr__(self):
+            return '<ResourceOverlay {}>'.format(self.delta)
+
+        def apply(self, base):
+            """
+            The resource with the changes; base is not changed
+            """
+            return merged(base if isinstance(base, dict) else {}, self.delta)
+
+        def to_state(self):
+            return self.delta
+
+        @classmethod
+        def from_state(cls, state):
+            return cls(state)
+
+
+# status lines with the Server header by (protocol, code), and the Date header line of the current second
+status_lines = dict()
+date_lines = [None, b'']
+
+
+def status_line(protocol, code, server):
+    key = (protocol, code)
+    if key not in status_lines:
+        message = BaseHTTPRequestHandler.responses.get(code, ('',))[0]
+        status_lines[key] = "{} {} {}\r\nServer: {}\r\n".format(protocol, code, message, server).encode('latin-1', 'strict')
+    return status_lines[key]
+
+
+def date_line():
+    now = int(time.time())
+    second, line = date_lines
+    if second != now:
+        line = "Date: {}\r\n".format(email.utils.formatdate(now, usegmt=True)).encode('latin-1', 'strict')
+        date_lines[:] = [now, line]
+    return line
+
+
 def clean_path(path, isShort):
     path = path.strip('/')
     path = path.split('?', 1)[0]
@@ -69,6 +570,1132 @@ def clean_path(path, isShort):
     return path
 
 
+# $expand: '.' subordinate links, '*' all links, '~' links of the Links property, then ($levels=<n>)
+expand_pattern = re.compile(r'([.*~])(?:\(\$levels=(\d+)\))?$')
+expand_max_levels = 6
+# resources inlined into one $expand response at most, the links beyond stay references
+expand_limit = 1000
+
+
+def expand_query(query_pieces):
+    """
+    Parse the $expand query of a request
+    :param query_pieces: parsed query
+    :return: (kind, levels), or None if there is no $expand
+    :raises ValueError: if it is not one of the supported forms
+    """
+    if '$expand' not in query_pieces:
+        return None
+    match = expand_pattern.match(query_pieces['$expand'][0].strip())
+    if match is None:
+        raise ValueError('unsupported $expand {}'.format(query_pieces['$expand'][0]))
+    levels = int(match.group(2)) if match.group(2) is not None else 1
+    if not 1 <= levels <= expand_max_levels:
+        raise ValueError('$levels must be 1 to {}'.format(expand_max_levels))
+    return match.group(1), levels
+
+
+def find_links(payload):
+    """
+    References of a payload to other resources, the edges of the link graph $expand follows
+    :return: tuple of (keys, uri, inLinks): the keys leading from the payload to a {"@odata.id": uri}
+        object, and whether it is within a Links property
+    """
+    found = []
+
+    def walk(value, keys, inLinks):
+        if isinstance(value, dict):
+            if keys and len(value) == 1 and isinstance(value.get('@odata.id'), str):
+                # references to a part of a resource are not expanded
+                if '#' not in value['@odata.id']:
+                    found.append((keys, value['@odata.id'], inLinks))
+                return
+            for k, v in value.items():
+                if isinstance(v, (dict, list)):
+                    walk(v, keys + (k,), inLinks or k == 'Links')
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                if isinstance(v, (dict, list)):
+                    walk(v, keys + (i,), inLinks)
+
+    walk(payload, (), False)
+    return tuple(found)
+
+
+def resident_memory():
+    """
+    Resident memory of this process in bytes, or None where it can't be read cheaply
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # peak rather than current size, reported in KB on linux and bytes on macOS
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage if sys.platform == 'darwin' else usage * 1024
+
+
+class MockupResource(object):
+        '''
+        files of one mockup resource directory, or one directly served file, held in memory
+        '''
+        __slots__ = ('body', 'headers', 'times', 'xmlPath', 'filePath')
+
+        def __init__(self):
+            self.body = None        # parsed index.json
+            self.headers = None     # parsed headers.json
+            self.times = None       # parsed time.json
+            self.xmlPath = None     # path of index.xml
+            self.filePath = None    # path of a file served as is
+
+        def copy(self):
+            other = MockupResource()
+            for name in self.__slots__:
+                setattr(other, name, getattr(self, name))
+            return other
+
+
+class DiskResource(object):
+        '''
+        same interface as MockupResource, reading the mockup directory when a file is first needed
+        '''
+        def __init__(self, mockDir, rpath):
+            self.dirPath = os.path.join(mockDir, rpath)
+            self.loaded = dict()
+
+        def load(self, rfile):
+            if rfile not in self.loaded:
+                self.loaded[rfile] = load_json_file(os.path.join(self.dirPath, rfile))
+            return self.loaded[rfile]
+
+        @property
+        def body(self):
+            if 'index.json' not in self.loaded:
+                self.loaded['index.json'] = load_resource_file(os.path.join(self.dirPath, 'index.json'))
+            return self.loaded['index.json']
+
+        @property
+        def headers(self):
+            return self.load('headers.json')
+
+        @property
+        def times(self):
+            return self.load('time.json')
+
+        @property
+        def xmlPath(self):
+            path = os.path.join(self.dirPath, 'index.xml')
+            return path if os.path.isfile(path) else None
+
+        @property
+        def filePath(self):
+            return self.dirPath if os.path.isfile(self.dirPath) else None
+
+
+class ContentPool(object):
+        '''
+        parsed json files keyed by their content, so that a file found in several mockups,
+        or several times in one, is held in memory once; the parsed objects must not be changed
+        '''
+        def __init__(self):
+            self.objects = dict()
+            self.lock = threading.Lock()
+            self.files = 0
+
+        def load(self, path, parse):
+            """
+            Parsed content of the file at path
+            :param parse: parse_json or parse_resource, applied to the bytes of the file
+            """
+            with open(path, 'rb') as f:
+                data = f.read()
+            key = (parse.__name__, hashlib.sha1(data).digest())
+            with self.lock:
+                self.files += 1
+                obj = self.objects.get(key)
+            if obj is None:
+                obj = parse(data)
+                with self.lock:
+                    obj = self.objects.setdefault(key, obj)
+            return obj
+
+        def counters(self):
+            return {'files': self.files, 'distinct': len(self.objects)}
+
+
+class MockupIndex(object):
+        '''
+        URI-keyed index of every resource in a mockup directory, read once at startup
+        '''
+        missing = MockupResource()
+
+        def __init__(self, mockDir, pool=None):
+            """__init__
+
+            :param mockDir: mockup directory
+            :param pool: ContentPool shared with the indexes of other mockups, None to parse every file on its own
+            """
+            self.mockDir = mockDir
+            self.pool = pool
+            self.resources = dict()
+
+        def get(self, rpath):
+            return self.resources.get(rpath, self.missing)
+
+        def entry(self, rpath):
+            if rpath not in self.resources:
+                self.resources[rpath] = MockupResource()
+            return self.resources[rpath]
+
+        def load(self):
+            """
+            Walk the mockup directory and parse every index.json, headers.json and time.json
+            :return: (number of resources, seconds taken, growth of resident memory in bytes or None)
+            """
+            start = time.time()
+            memory = resident_memory()
+            for dirpath, dirnames, filenames in os.walk(self.mockDir):
+                rpath = os.path.relpath(dirpath, self.mockDir).replace(os.sep, '/')
+                rpath = '' if rpath == '.' else rpath
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        self.load_file(rpath, filename, path, self.entry)
+                    except ValueError as e:
+                        print("WARNING: skipping invalid json file {}: {}".format(path, e), file=sys.stderr)
+            size = resident_memory() - memory if memory is not None else None
+            count = sum(1 for r in self.resources.values() if r.body is not None)
+            return count, time.time() - start, size
+
+        def load_file(self, rpath, filename, path, entry):
+            # every file can also be requested directly by its own path
+            entry(posixpath.join(rpath, filename)).filePath = path
+            if filename == 'index.json':
+                entry(rpath).body = self.read(path, parse_resource)
+            elif filename == 'headers.json':
+                entry(rpath).headers = self.read(path, parse_json)
+            elif filename == 'time.json':
+                entry(rpath).times = self.read(path, parse_json)
+            elif filename == 'index.xml':
+                entry(rpath).xmlPath = path
+
+        def read(self, path, parse):
+            if self.pool is not None:
+                return self.pool.load(path, parse)
+            with open(path, 'rb') as f:
+                return parse(f.read())
+
+        def reload(self, rpath, filename):
+            """
+            Read a file of the mockup again, or forget it if it is gone
+            Entries are replaced rather than changed, so requests being served keep a consistent resource
+            :raises ValueError: if the file is not valid json, the entry is left as it was
+            """
+            replaced = dict()
+
+            def entry(key):
+                if key not in replaced:
+                    replaced[key] = self.get(key).copy()
+                return replaced[key]
+            path = os.path.join(self.mockDir, rpath, filename)
+            if os.path.isfile(path):
+                self.load_file(rpath, filename, path, entry)
+            else:
+                entry(posixpath.join(rpath, filename)).filePath = None
+                field = {'index.json': 'body', 'headers.json': 'headers', 'time.json': 'times', 'index.xml': 'xmlPath'}.get(filename)
+                if field is not None:
+                    setattr(entry(rpath), field, None)
+            self.resources.update(replaced)
+
+
+class PackedResource(object):
+        '''
+        same interface as MockupResource, parsing the files of a packed mockup on first use
+        '''
+        def __init__(self, pack, rpath):
+            self.pack = pack
+            self.rpath = rpath
+            self.loaded = dict()
+
+        def load(self, rfile, parse):
+            if rfile not in self.loaded:
+                data = self.pack.read(posixpath.join(self.rpath, rfile))
+                self.loaded[rfile] = parse(data) if data is not None else None
+            return self.loaded[rfile]
+
+        @property
+        def body(self):
+            return self.load('index.json', parse_resource)
+
+        @property
+        def headers(self):
+            return self.load('headers.json', parse_json)
+
+        @property
+        def times(self):
+            return self.load('time.json', parse_json)
+
+        @property
+        def xmlPath(self):
+            name = posixpath.join(self.rpath, 'index.xml')
+            return os.path.join(self.pack.path, name) if self.pack.isfile(name) else None
+
+        @property
+        def filePath(self):
+            return os.path.join(self.pack.path, self.rpath) if self.pack.isfile(self.rpath) else None
+
+        @property
+        def serialized(self):
+            # the GET response body of the unchanged resource, stored in the pack
+            return self.pack.body(self.rpath)
+
+
+class PackedIndex(object):
+        '''
+        same interface as MockupIndex for a packed mockup: resources are looked up in the pack's table,
+        their files are parsed when first needed
+        '''
+        def __init__(self, pack):
+            self.pack = pack
+            self.resources = dict()
+
+        def get(self, rpath):
+            resource = self.resources.get(rpath)
+            if resource is None:
+                if not (self.pack.isdir(rpath) or self.pack.isfile(rpath)):
+                    return MockupIndex.missing
+                resource = self.resources.setdefault(rpath, PackedResource(self.pack, rpath))
+            return resource
+
+        def load(self):
+            """
+            Parse every index.json, headers.json and time.json of the pack, for --preload
+            :return: (number of resources, seconds taken, growth of resident memory in bytes or None)
+            """
+            start = time.time()
+            memory = resident_memory()
+            count = 0
+            for rpath in self.pack.dirs:
+                resource = self.get(rpath)
+                count += resource.body is not None
+                # parsed once here, kept by the resource
+                resource.headers
+                resource.times
+            size = resident_memory() - memory if memory is not None else None
+            return count, time.time() - start, size
+
+
+def header_block(headers, sendHeaders):
+    """
+    Header lines of a GET response of a resource, as they are written to the socket
+    :param headers: parsed headers.json of the resource, or None
+    :param sendHeaders: -X, send the GET headers of headers.json
+    :return: bytes, each line ending in CRLF
+    """
+    lines = []
+    if sendHeaders and headers is not None:
+        if isinstance(headers["GET"], dict):
+            for k, v in headers["GET"].items():
+                if k.lower() not in dont_send:
+                    lines.append("{}: {}\r\n".format(k, v))
+    elif headers is None:
+        lines.append("Content-Type: application/json\r\n")
+        lines.append("OData-Version: 4.0\r\n")
+    return ''.join(lines).encode('latin-1', 'strict')
+
+
+def resource_etag(body):
+    """
+    Strong etag of a serialized response, so it changes with every change of the resource
+    """
+    return '"{}"'.format(hashlib.sha1(body).hexdigest()[:20])
+
+
+def etag_matches(header, etag):
+    """
+    True if an If-Match or If-None-Match header value is * or lists etag
+    W/ prefixes are ignored, Redfish clients send weak etags in If-Match as well
+    """
+    if header is None:
+        return False
+    if header.strip() == '*':
+        return True
+    etag = etag[2:] if etag.startswith('W/') else etag
+    for tag in header.split(','):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith('W/') else tag) == etag:
+            return True
+    return False
+
+
+# --compress: bodies shorter than this are sent as they are, compressing them saves next to nothing
+compress_min = 1024
+
+# compressed files served as they are, by (path, encoding): ((mtime, size) of the file, compressed body)
+compressed_files = dict()
+
+
+def choose_encoding(header):
+    """
+    Content coding for an Accept-Encoding header value: 'gzip', 'deflate' or None for the body as it is
+    """
+    if not header:
+        return None
+    accepted = dict()
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        for param in params.split(';'):
+            key, _, value = param.partition('=')
+            if key.strip() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        accepted[name.strip().lower()] = q
+    for encoding in ('gzip', 'deflate'):
+        if accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return None
+
+
+def compress(body, encoding):
+    # gzip framing, or the zlib framing HTTP calls deflate
+    c = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS if encoding == 'gzip' else zlib.MAX_WBITS)
+    return c.compress(body) + c.flush()
+
+
+def compressed_file(path, encoding):
+    """
+    Compressed content of a file, compressed again only when the file changes
+    """
+    f, offset, size, mtime = open_mockup_file(path)
+    with f:
+        stamp = (mtime, size)
+        entry = compressed_files.get((path, encoding))
+        if entry is None or entry[0] != stamp:
+            f.seek(offset)
+            entry = (stamp, compress(f.read(size), encoding))
+            compressed_files[(path, encoding)] = entry
+    return entry[1]
+
+
+class CachedResponse(object):
+        '''
+        serialized GET response of one resource, with its header lines
+        '''
+        __slots__ = ('status', 'body', 'length', 'block', 'head', 'etag', 'etagLine', 'variants')
+
+        def __init__(self, status, body, head=b'', etag=None):
+            """__init__
+
+            :param status: response status code
+            :param body: encoded body
+            :param head: header_block of the resource, Content-Length is added
+            :param etag: ETag of the response, see resource_etag, or None
+            """
+            self.status = status
+            self.body = body
+            self.length = str(len(body))
+            self.block = head
+            self.head = head + b'Content-Length: ' + self.length.encode() + b'\r\n'
+            self.etag = etag
+            self.etagLine = 'ETag: {}\r\n'.format(etag).encode() if etag is not None else b''
+            self.variants = None
+
+        def encoded(self, encoding):
+            """
+            (body, header lines, ETag line) of the response compressed with encoding, compressed on first use
+            """
+            if self.variants is None:
+                self.variants = dict()
+            variant = self.variants.get(encoding)
+            if variant is None:
+                body = compress(self.body, encoding)
+                head = self.block + 'Content-Encoding: {}\r\nContent-Length: {}\r\n'.format(encoding, len(body)).encode()
+                # a compressed body is a different representation, only weakly the same as the etag's
+                etagLine = 'ETag: W/{}\r\n'.format(self.etag).encode() if self.etag is not None else b''
+                variant = self.variants[encoding] = (body, head, etagLine)
+            return variant
+
+
+class ResponseCache(object):
+        '''
+        serialized GET responses keyed by resource file path (the state store key)
+        entries are dropped when PATCH/POST/DELETE change the resource or its collection
+        '''
+        def __init__(self, shared=False, ringSize=4096):
+            """__init__
+
+            :param shared: keep the mutation counter and the invalidated paths in shared memory for forked server processes
+            :param ringSize: invalidated paths remembered for the other processes; one that falls further behind drops all entries
+            """
+            self.entries = dict()
+            self.lock = threading.Lock()
+            # bumped for every invalidated path, whose key goes to ring[version % ringSize] for the other processes
+            ctx = multiprocessing.get_context('fork')
+            self.version = ctx.Value('Q', 0) if shared else None
+            self.ring = ctx.Array('Q', ringSize, lock=False) if shared else None
+            self.paths = dict()         # ring key: path, of the paths with entries
+            self.seen = 0
+
+        def sync(self):
+            if self.version is not None and self.version.value != self.seen:
+                with self.lock:
+                    self.catch_up()
+
+        def catch_up(self):
+            """
+            Drop the entries of the paths other processes invalidated since seen; the lock is held
+            """
+            version = self.version.value
+            if version - self.seen <= len(self.ring):
+                for n in range(self.seen, version):
+                    key = self.ring[n % len(self.ring)]
+                    if key == 0:
+                        # a clear
+                        self.discard_all()
+                        break
+                    path = self.paths.pop(key, None)
+                    if path is not None:
+                        self.discard(path)
+            # the ring may have wrapped around over the keys read
+            if self.version.value - self.seen > len(self.ring):
+                self.discard_all()
+            self.seen = version
+
+        def ring_key(self, path):
+            # forked processes hash strings alike; 0 stands for a clear
+            return (hash(path) & 0xFFFFFFFFFFFFFFFF) or 1
+
+        def track(self, path):
+            # the lock is held; remember the path of an entry, so the other processes' invalidations find it
+            if self.ring is not None:
+                self.paths[self.ring_key(path)] = path
+
+        def begin(self):
+            """
+            Call before reading the resource; pass the result to put
+            """
+            self.sync()
+            return self.seen
+
+        def get(self, path):
+            self.sync()
+            return self.entries.get(path)
+
+        def put(self, path, token, response):
+            with self.lock:
+                # skip responses read before a change that landed while serializing
+                if token == self.seen:
+                    self.entries[path] = response
+                    self.track(path)
+
+        def clear(self):
+            """
+            Drop every entry, in all server processes
+            """
+            # bump the version first, so responses read before the reset are not put back
+            self.invalidate()
+            with self.lock:
+                self.discard_all()
+
+        def invalidate(self, *paths):
+            """
+            Drop the entries of paths in every process, without paths all entries
+            """
+            with self.lock:
+                if self.version is None:
+                    self.seen += 1
+                else:
+                    with self.version.get_lock():
+                        self.catch_up()
+                        for path in paths or (None,):
+                            self.ring[self.version.value % len(self.ring)] = self.ring_key(path) if path is not None else 0
+                            self.version.value += 1
+                        self.seen = self.version.value
+                for path in paths:
+                    self.discard(path)
+
+        def discard(self, path):
+            # the lock is held
+            self.entries.pop(path, None)
+
+        def discard_all(self):
+            # the lock is held
+            self.entries.clear()
+            self.paths.clear()
+
+
+class ExpandCache(ResponseCache):
+        '''
+        $expand responses keyed by (resource file path, expand kind, levels), each dropped when any of the
+        resources it includes changes; also holds the link graph of the resources expanded so far
+        the least recently used responses are dropped beyond maxEntries or maxBytes
+        '''
+        def __init__(self, shared=False, maxEntries=1000, maxBytes=64 * 1048576):
+            """__init__
+
+            :param shared: keep the mutation counter and the invalidated paths in shared memory for forked server processes
+            :param maxEntries: responses kept at most
+            :param maxBytes: body bytes of the responses kept at most
+            """
+            ResponseCache.__init__(self, shared)
+            self.entries = collections.OrderedDict()
+            self.maxEntries = maxEntries
+            self.maxBytes = maxBytes
+            self.size = 0
+            self.dependents = dict()    # resource file path: keys of the responses including it
+            self.graph = dict()         # resource file path: links of its payload, see find_links
+
+        def get(self, key):
+            self.sync()
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is None:
+                    return None
+                self.entries.move_to_end(key)
+                return entry[0]
+
+        def put(self, key, token, response, paths=()):
+            """
+            :param paths: file paths of every resource the response includes
+            """
+            with self.lock:
+                if token != self.seen:
+                    return
+                self.drop(key)
+                self.entries[key] = (response, paths)
+                self.size += len(response.body)
+                for path in paths:
+                    self.dependents.setdefault(path, set()).add(key)
+                    self.track(path)
+                while self.entries and (len(self.entries) > self.maxEntries or self.size > self.maxBytes):
+                    self.drop(next(iter(self.entries)))
+
+        def links(self, path, token, payload):
+            """
+            Links of the payload of the resource at path, found once until it changes
+            """
+            links = self.graph.get(path)
+            if links is None:
+                links = find_links(payload)
+                with self.lock:
+                    if token == self.seen:
+                        if len(self.graph) >= 100 * self.maxEntries:
+                            self.graph.clear()
+                        self.graph[path] = links
+                        self.track(path)
+            return links
+
+        def drop(self, key):
+            # the lock is held
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return
+            self.size -= len(entry[0].body)
+            for path in entry[1]:
+                keys = self.dependents.get(path)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del self.dependents[path]
+
+        def discard(self, path):
+            self.graph.pop(path, None)
+            for key in list(self.dependents.get(path, ())):
+                self.drop(key)
+
+        def discard_all(self):
+            self.entries.clear()
+            self.dependents.clear()
+            self.graph.clear()
+            self.paths.clear()
+            self.size = 0
+
+
+class PropertyIndex(ResponseCache):
+        '''
+        values of the properties $filter looked at, by member resource file path; a member's values are
+        dropped when PATCH/POST/DELETE change it, and taken from its payload again when next needed
+        '''
+        def values(self, path, token, properties, load):
+            """
+            Values of the properties of the member at path
+            :param token: from begin, taken before the member is read
+            :param properties: property paths, see rfMockupQuery.property_path
+            :param load: returns the member's payload, or None if it has none
+            :return: {property path: value}, or None if the member has no payload
+            """
+            row = self.entries.get(path)
+            if row is None or not properties.issubset(row):
+                payload = load()
+                if payload is None:
+                    return None
+                row = dict(row or {})
+                for prop in properties:
+                    row[prop] = lookup(payload, prop)
+                self.put(path, token, row)
+            return row
+
+
+# a /redfish/v1 reference at the start of a json string
+redfish_reference = re.compile(rb'"/redfish/v1(?=[/"?#])')
+
+
+class MockupInstance(object):
+        '''
+        one emulated service: a mockup directory and the PATCH/POST/DELETE changes made to it
+        instances of the same mockup share its preload index, each keeps its own changes and response cache
+        '''
+        def __init__(self, name, mockDir, shortForm=False, links=None, lock=None, resourceIndex=None, responseCache=None,
+                     expandCache=None, propertyIndex=None, prefix=None):
+            """__init__
+
+            :param name: name in log lines and journal file names, '' for the only instance
+            :param mockDir: real path of the mockup directory
+            :param shortForm: mockup served without the /redfish/v1 prefix
+            :param links: resources changed by PATCH/POST/DELETE, keyed by index.json path; '404' marks a deleted resource
+            :param lock: guards read-modify-write sequences on links (PATCH/POST/DELETE)
+            :param resourceIndex: MockupIndex of --preload, None to read the mockup from disk
+            :param responseCache: ResponseCache of --cache, None to serialize every response
+            :param expandCache: ExpandCache of --cache for $expand responses, None to expand every time
+            :param propertyIndex: PropertyIndex of the members $filter looked at, default one of this process
+            :param prefix: first path segment selecting the instance, its links are served below it; None for none
+            """
+            self.name = name
+            self.mockDir = mockDir
+            self.shortForm = shortForm
+            self.links = links if links is not None else RfMutationStore()
+            self.lock = lock if lock is not None else threading.RLock()
+            self.resourceIndex = resourceIndex
+            self.responseCache = responseCache
+            self.expandCache = expandCache
+            self.propertyIndex = propertyIndex if propertyIndex is not None else PropertyIndex()
+            self.prefix = '/' + prefix.strip('/') if prefix else ''
+            self.prefixed = b'"' + self.prefix.encode() + b'/redfish/v1'
+
+        def invalidate(self, *fpaths):
+            """
+            Drop the cached responses of the resources at fpaths, the $expand responses including them and their $filter values
+            """
+            for cache in (self.responseCache, self.expandCache, self.propertyIndex):
+                if cache is not None:
+                    cache.invalidate(*fpaths)
+
+        def rewrite(self, body):
+            """
+            Serialized json body with its /redfish/v1 references moved below the prefix, so that
+            clients following them stay on this instance
+            """
+            return redfish_reference.sub(self.prefixed, body) if self.prefix else body
+
+        def clear_caches(self):
+            for cache in (self.responseCache, self.expandCache, self.propertyIndex):
+                if cache is not None:
+                    cache.clear()
+
+        def __repr__(self):
+            return '<MockupInstance {} of {}>'.format(self.name, self.mockDir)
+
+
+def apply_jitter(seconds, jitter):
+    """
+    Vary a response time by the --jitter distribution
+    :param seconds: nominal response time
+    :param jitter: (distribution, spread) with distribution one of fixed, uniform, normal
+    :return: response time, never negative
+    """
+    dist, spread = jitter
+    if seconds <= 0 or dist == 'fixed' or spread <= 0:
+        return seconds
+    if dist == 'uniform':
+        seconds += random.uniform(-spread, spread)
+    elif dist == 'normal':
+        seconds += random.gauss(0, spread)
+    return max(seconds, 0)
+
+
+class LatencyScheduler(object):
+        '''
+        timer thread that holds delayed responses and hands them back to a worker pool when due
+        '''
+        def __init__(self, executor):
+            self.executor = executor
+            self.queue = []     # heap of (due time, sequence, callback)
+            self.sequence = itertools.count()
+            self.condition = threading.Condition()
+            self.thread = threading.Thread(target=self.run, name='rfMockupLatency')
+            self.thread.daemon = True
+            self.thread.start()
+
+        def schedule(self, delay, callback):
+            with self.condition:
+                heapq.heappush(self.queue, (time.monotonic() + delay, next(self.sequence), callback))
+                self.condition.notify()
+
+        def run(self):
+            while True:
+                with self.condition:
+                    while not self.queue:
+                        self.condition.wait()
+                    due = self.queue[0][0]
+                    wait = due - time.monotonic()
+                    if wait > 0:
+                        self.condition.wait(wait)
+                        continue
+                    callback = heapq.heappop(self.queue)[2]
+                self.executor.submit(callback)
+
+
+class MockupWatcher(object):
+        '''
+        thread that polls the modification times of the mockup files and reports the files changed
+        '''
+        def __init__(self, mockDir, interval, callback):
+            """__init__
+
+            :param mockDir: directory to watch
+            :param interval: seconds between polls
+            :param callback: called with the list of paths added, changed or removed; returns the paths
+                that could not be read yet, which are reported again at the next poll
+            """
+            self.mockDir = mockDir
+            self.interval = interval
+            self.callback = callback
+            self.known = self.scan()
+            self.thread = threading.Thread(target=self.run, name='rfMockupWatch')
+            self.thread.daemon = True
+            self.thread.start()
+
+        def scan(self):
+            """
+            {path: (mtime, size)} of every file under mockDir
+            """
+            found = dict()
+            dirs = [self.mockDir]
+            while dirs:
+                try:
+                    entries = os.scandir(dirs.pop())
+                except OSError:
+                    continue
+                with entries:
+                    for e in entries:
+                        try:
+                            if e.is_dir():
+                                dirs.append(e.path)
+                            else:
+                                st = e.stat()
+                                found[e.path] = (st.st_mtime_ns, st.st_size)
+                        except OSError:
+                            pass
+            return found
+
+        def poll(self):
+            found = self.scan()
+            changed = [path for path, stamp in found.items() if self.known.get(path) != stamp]
+            changed.extend(path for path in self.known if path not in found)
+            self.known = found
+            if changed:
+                for path in self.callback(changed) or ():
+                    self.known.pop(path, None)
+
+        def run(self):
+            spent = 0
+            while True:
+                # a large mockup is polled less often, so that polling takes at most a fifth of a core
+                time.sleep(max(self.interval, 4 * spent))
+                start = time.monotonic()
+                try:
+                    self.poll()
+                except Exception:
+                    logger.exception("Watching the mockup directory failed")
+                spent = time.monotonic() - start
+
+
+def apply_mockup_changes(instances, paths, state=True, index=True):
+    """
+    Bring the preload index, the response caches and the PATCH/POST/DELETE changes up to date with changed mockup files
+    :param instances: the MockupInstances serving the mockup directory that changed
+    :param paths: files added, changed or removed
+    :param state: drop the PATCH/POST/DELETE changes of resources whose index.json changed
+    :param index: read the files again into this process's preload index
+    :return: the paths that could not be read
+    """
+    mockDir = instances[0].mockDir
+    # instances of one mockup share its index, it is read once
+    indexes = list({id(i.resourceIndex): i.resourceIndex for i in instances if i.resourceIndex is not None}.values())
+    failed = []
+    fpaths = set()
+    clearAll = False
+    for path in paths:
+        rpath, filename = posixpath.split(os.path.relpath(path, mockDir).replace(os.sep, '/'))
+        fpath = os.path.join(mockDir, rpath, 'index.json')
+        if index:
+            try:
+                for resourceIndex in indexes:
+                    resourceIndex.reload(rpath, filename)
+            except ValueError as e:
+                logger.warning("Changed file %s is not valid json yet: %s", path, e)
+                failed.append(path)
+                continue
+        fpaths.add(fpath)
+        if filename == 'index.json':
+            if state:
+                for instance in instances:
+                    if fpath in instance.links:
+                        with instance.lock:
+                            del instance.links[fpath]
+            try:
+                body = load_json_file(path)
+            except ValueError:
+                body = None
+            if isinstance(body, dict) and 'Members@Mockup.Template' in body:
+                # the members generated from the template are cached under their own paths
+                clearAll = True
+    for instance in instances:
+        if clearAll:
+            instance.clear_caches()
+        elif fpaths:
+            instance.invalidate(*fpaths)
+    if len(paths) > len(failed):
+        logger.info("Mockup %s changed: %d files reloaded", mockDir, len(paths) - len(failed))
+    return failed
+
+
+def watch_mockup(instances, interval, state=True, index=True):
+    """
+    Start a MockupWatcher per mockup directory applying its changes to this process, see apply_mockup_changes
+    :param instances: MockupInstances to keep up to date
+    :param interval: seconds between polls
+    :return: list of the MockupWatchers
+    """
+    byDir = dict()
+    for instance in instances:
+        # a packed mockup is not changed in place, it is packed again
+        if instance.mockDir not in packed_mockups:
+            byDir.setdefault(instance.mockDir, []).append(instance)
+    return [MockupWatcher(mockDir, interval, lambda paths, group=group: apply_mockup_changes(group, paths, state, index))
+            for mockDir, group in byDir.items()]
+
+
+class WorkerPool(object):
+        '''
+        bounded pool of worker threads, shared by the servers of all ports of one process
+        '''
+        def __init__(self, workers, backlog=None):
+            """__init__
+
+            :param workers: number of worker threads
+            :param backlog: accepted connections allowed to wait for a worker, default 4 * workers
+            """
+            self.workers = workers
+            self.backlog = backlog if backlog is not None else 4 * workers
+            self.executor = None
+            self.scheduler = None
+            self.slots = threading.BoundedSemaphore(self.workers + self.backlog)
+            self.lock = threading.Lock()
+
+        def start(self):
+            # the executor is created lazily so that forked worker processes get their own threads
+            with self.lock:
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='rfMockup')
+                    self.scheduler = LatencyScheduler(self.executor)
+
+        def shutdown(self):
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+
+
+def make_ssl_context(certfile, keyfile, ciphers=None, tickets=2):
+    """
+    TLS settings of the https ports; one context serves all their connections, so that clients can
+    resume their sessions from its session cache or with its session tickets
+    :param certfile: certificate chain in PEM format
+    :param keyfile: private key in PEM format
+    :param ciphers: OpenSSL cipher list for TLS 1.2, default the OpenSSL defaults
+    :param tickets: session tickets issued after each TLS 1.3 handshake, 0 for no tickets
+    :return: ssl.SSLContext
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(certfile, keyfile)
+    context.minimum_version = ssl.TLSVersion.TLSv1_2
+    context.options |= ssl.OP_NO_COMPRESSION | ssl.OP_CIPHER_SERVER_PREFERENCE
+    if ciphers:
+        context.set_ciphers(ciphers)
+    if tickets == 0:
+        context.options |= ssl.OP_NO_TICKET
+    elif hasattr(context, 'num_tickets'):
+        context.num_tickets = tickets
+    return context
+
+
+class TLSHTTPServer(HTTPServer):
+        '''
+        HTTPServer whose accepted connections are wrapped in TLS when sslContext is set; the handshake is
+        left to the request handler, so that it does not hold up the accept loop
+        '''
+        sslContext = None
+
+        def get_request(self):
+            request, client_address = self.socket.accept()
+            if self.sslContext is not None:
+                request = self.sslContext.wrap_socket(request, server_side=True, do_handshake_on_connect=False)
+            return request, client_address
+
+
+class ThreadPoolHTTPServer(TLSHTTPServer):
+        '''
+        HTTPServer that hands accepted connections to a bounded pool of worker threads
+        '''
+        # allow a burst of parallel clients to queue in the kernel while workers are busy
+        request_queue_size = 128
+
+        def __init__(self, server_address, RequestHandlerClass, workers, backlog=None, bind_and_activate=True, pool=None):
+            """__init__
+
+            :param server_address: (host, port) tuple to listen on
+            :param RequestHandlerClass: handler class for each connection
+            :param workers: number of worker threads
+            :param backlog: accepted connections allowed to wait for a worker, default 4 * workers
+            :param pool: WorkerPool shared with the servers of other ports, default a pool of this server's own
+            """
+            TLSHTTPServer.__init__(self, server_address, RequestHandlerClass, bind_and_activate)
+            self.pool = pool if pool is not None else WorkerPool(workers, backlog)
+
+        def process_request(self, request, client_address):
+            if self.pool.executor is None:
+                self.pool.start()
+            # block the accept loop once the pool and its backlog are full
+            self.pool.slots.acquire()
+            self.pool.executor.submit(self.process_request_thread, request, client_address)
+
+        def finish_request(self, request, client_address):
+            return self.RequestHandlerClass(request, client_address, self)
+
+        def process_request_thread(self, request, client_address):
+            handler = None
+            try:
+                handler = self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                # a delayed response does not hold a worker slot while it waits
+                if getattr(handler, 'deferred', False):
+                    self.defer(handler)
+                else:
+                    self.shutdown_request(request)
+                self.pool.slots.release()
+
+        def defer(self, handler):
+            self.pool.scheduler.schedule(handler.pendingDelay, handler.resume)
+
+        def server_close(self):
+            TLSHTTPServer.server_close(self)
+            self.pool.shutdown()
+
+
+def start_state_manager():
+    """
+    Start a manager process to keep the state stores in, so that forked server
+    processes see each other's PATCH/POST/DELETE changes
+    """
+    # Ctrl-C reaches the whole process group; the manager must outlive the servers to close the journals
+    manager = RfStoreManager(ctx=multiprocessing.get_context('fork'))
+    manager.start(signal.signal, (signal.SIGINT, signal.SIG_IGN))
+    return manager
+
+
+def open_state_store(path=None, limit=None, root='', manager=None):
+    """
+    Create the store of one instance's PATCH/POST/DELETE changes, configured from the command line
+    :param path: journal file to replay and append to, None to keep the state in memory only
+    :param limit: bytes of state allowed, None for no limit
+    :param root: mockup directory, left out of the journal keys
+    :param manager: manager from start_state_manager to keep the store and its lock in, None to keep them in this process
+    :return: (store, lock, number of journal records replayed)
+    """
+    args = (path, limit, root, (MemberCollection, ResourceOverlay), restore_state, edit_members)
+    if manager is not None:
+        store, lock = manager.RfMutationStore(*args), manager.RLock()
+    else:
+        store, lock = RfMutationStore(*args), threading.RLock()
+    replayed = store.open() if path is not None else 0
+    return store, lock, replayed
+
+
+def stop_on_sigterm():
+    """
+    Treat SIGTERM like Ctrl-C, so the server shuts down cleanly
+    """
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+    signal.signal(signal.SIGTERM, terminate)
+
+
+def serve_all(servers):
+    """
+    Serve every port until interrupted, the first one in the calling thread
+    :param servers: bound and activated HTTPServers
+    """
+    if servers[0].asyncio:
+        # one event loop serves every port
+        serve_asyncio(servers)
+        return
+    for server in servers[1:]:
+        t = threading.Thread(target=server.serve_forever, name='rfMockupPort{}'.format(server.server_address[1]))
+        t.daemon = True
+        t.start()
+    try:
+        servers[0].serve_forever()
+    finally:
+        for server in servers[1:]:
+            server.shutdown()
+
+
+def serve_worker(servers):
+    server = servers[0]
+    # the log writer thread of the parent is not forked
+    server.log.start()
+    if server.watchInterval:
+        # the parent process updates the state stores and the shared response caches, each process its own index
+        watch_mockup(server.instances, server.watchInterval, state=False)
+    try:
+        serve_all(servers)
+    except KeyboardInterrupt:
+        pass
+
+
+def serve_processes(servers, count):
+    """
+    Fork count processes that all accept connections from the listening sockets of servers
+    :param servers: bound and activated HTTPServers
+    :param count: number of server processes
+    :return: None
+    """
+    ctx = multiprocessing.get_context('fork')
+    workers = [ctx.Process(target=serve_worker, args=(servers,), daemon=True) for _ in range(count)]
+    for worker in workers:
+        worker.start()
+
+    # the workers are not left behind
+    stop_on_sigterm()
+    try:
+        for worker in workers:
+            worker.join()
+    finally:
+        for worker in workers:
+            if worker.is_alive():
+                worker.terminate()
+            worker.join()
+
+
 class RfMockupServer(BaseHTTPRequestHandler):
         '''
         returns index.json file for Serverthe specified URL
@@ -76,188 +1703,432 @@ class RfMockupServer(BaseHTTPRequestHandler):
         server_version = "RedfishMockupHTTPD_v" + tool_version
         event_id = 1
 
+        def setup(self):
+            self.setup_connection()
+            BaseHTTPRequestHandler.setup(self)
+            self.handshaken = self.handshake()
+
+        def handshake(self):
+            """
+            Complete the TLS handshake of an https connection, in the thread serving it
+            :return: False if it failed, the connection is closed then
+            """
+            if not isinstance(self.connection, ssl.SSLSocket):
+                return True
+            timeout = self.connection.gettimeout()
+            self.connection.settimeout(handshake_timeout)
+            try:
+                self.connection.do_handshake()
+            except (ssl.SSLError, OSError) as e:
+                logger.info("TLS handshake with %s failed: %s", self.client_address[0], e)
+                return False
+            self.connection.settimeout(timeout)
+            return True
+
+        def setup_connection(self):
+            """
+            Settings and counters of a new connection; the --asyncio engine calls this instead of setup
+            """
+            if self.server.keepAlive:
+                self.protocol_version = "HTTP/1.1"
+                # idle keep-alive connections are closed when the socket read times out
+                self.timeout = self.server.idleTimeout
+                # headers and body go out in separate writes; don't let the body wait for the client's delayed ack
+                self.disable_nagle_algorithm = True
+            self.requestCount = 0
+            # {phase: seconds} of the current request, None unless --metrics
+            self.phases = None
+            # the access and debug lines of the current request are logged
+            self.logged = False
+
+        def handle(self):
+            self.deferred = False
+            self.close_connection = True
+            if not self.handshaken:
+                return
+            self.handle_one_request()
+            while not self.close_connection and not self.deferred:
+                self.handle_one_request()
+
+        def handle_one_request(self):
+            self.requestStart = None
+            self.responseCode = None
+            if not self.server.asyncDelay:
+                BaseHTTPRequestHandler.handle_one_request(self)
+                self.record()
+                return
+            # buffer the whole response so that it can be sent later in one piece
+            self.pendingDelay = 0
+            socketWfile, self.wfile = self.wfile, io.BytesIO()
+            try:
+                BaseHTTPRequestHandler.handle_one_request(self)
+            finally:
+                response, self.wfile = self.wfile.getvalue(), socketWfile
+            if self.pendingDelay > 0 and response:
+                # the server hands the connection to its LatencyScheduler, see resume
+                self.deferred = True
+                self.deferredResponse = response
+            elif response:
+                self.lap(None)
+                self.wfile.write(response)
+                self.lap('write')
+            self.record()
+
+        def parse_request(self):
+            # timing starts once the request line is in, not while an idle connection waits
+            self.requestStart = self.lapStart = time.perf_counter()
+            self.logged = self.server.log.sampled()
+            if self.server.metrics is not None:
+                self.phases = dict()
+            if not BaseHTTPRequestHandler.parse_request(self):
+                return False
+            return self.select_instance()
+
+        def select_instance(self):
+            """
+            Pick the MockupInstance the request is for: the one of the port it came in on, unless the
+            first label of the Host header or the first segment of the path names another; a path
+            prefix is dropped from self.path
+            :return: False if there is none, a 404 has been sent then
+            """
+            self.instance = self.server.instance
+            if self.server.hosts:
+                host = self.headers.get('Host', '').split(':')[0].lower()
+                self.instance = self.server.hosts.get(host, self.server.hosts.get(host.split('.')[0], self.instance))
+            if self.server.prefixes and self.path.startswith('/'):
+                segment = self.path.split('/', 2)[1].split('?', 1)[0]
+                if segment in self.server.prefixes:
+                    self.instance = self.server.prefixes[segment]
+                    rest = self.path[len(segment) + 1:]
+                    self.path = rest if rest.startswith('/') else '/' + rest
+            if self.instance is None and not (self.server.metrics is not None and self.command == 'GET' and
+                                              self.path.split('?', 1)[0] == metrics_path):
+                self.send_error(404, "No mockup is served here")
+                return False
+            return True
+
+        def lap(self, phase):
+            """
+            Charge the time since the previous lap to phase, or drop it if phase is None
+            """
+            if self.phases is not None:
+                now = time.perf_counter()
+                if phase is not None:
+                    self.phases[phase] = self.phases.get(phase, 0) + now - self.lapStart
+                self.lapStart = now
+
+        def record(self):
+            """
+            Add the request just answered to the server's --metrics and to the access log
+            """
+            if self.requestStart is None or self.responseCode is None:
+                return
+            self.requestStart, start = None, self.requestStart
+            if self.phases is None and not self.logged:
+                return
+            seconds = time.perf_counter() - start
+            if self.deferred:
+                # the response waits on the LatencyScheduler for its delay
+                seconds += self.pendingDelay
+            if self.phases is not None:
+                if self.deferred:
+                    self.phases['delay'] = self.phases.get('delay', 0) + self.pendingDelay
+                self.server.metrics.record(self.command or '-', self.path.split('?', 1)[0], self.responseCode, seconds, self.phases)
+            if self.logged:
+                access_logger.info('%s - - [%s] "%s" %s %s %.6f', self.address_string(), self.log_date_time_string(),
+                                   self.requestline, self.responseCode, self.responseLength, seconds)
+
+        def log_request(self, code='-', size='-'):
+            # the access log line is written by record once the response is sent
+            pass
+
+        def log_message(self, format, *args):
+            # errors are logged whatever the sampling; the address and date are not formatted when they are off
+            if not logger.isEnabledFor(levels['warning']):
+                return
+            logger.warning("%s - - [%s] " + format, self.address_string(), self.log_date_time_string(), *args)
+
+        def log_debug(self, format, *args):
+            """
+            Log a debug line of a sampled request, the arguments are only formatted if it is written
+            """
+            if self.logged:
+                logger.debug(format, *args)
+
+        def resume(self):
+            """
+            Send a response held back by --asyncDelay, then keep serving the connection
+            """
+            self.deferred = False
+            try:
+                self.wfile.write(self.deferredResponse)
+                self.deferredResponse = None
+                while not self.close_connection and not self.deferred:
+                    self.handle_one_request()
+                if not self.deferred:
+                    self.finish()
+            except Exception:
+                self.deferred = False
+                self.server.handle_error(self.request, self.client_address)
+            if self.deferred:
+                self.server.defer(self)
+            else:
+                self.server.shutdown_request(self.request)
+
+        def finish(self):
+            # a deferred connection stays open until resume has sent its response
+            if not self.deferred:
+                BaseHTTPRequestHandler.finish(self)
+
+        def send_response(self, code, message=None):
+            self.responseCode = code
+            self.responseLength = '-'
+            self.sentLength = False
+            self.requestCount += 1
+            BaseHTTPRequestHandler.send_response(self, code, message)
+
+        def send_header(self, keyword, value):
+            if keyword.lower() == 'content-length':
+                self.sentLength = True
+                self.responseLength = value
+            BaseHTTPRequestHandler.send_header(self, keyword, value)
+
+        def send_whole(self, code, head, body):
+            """
+            Send a response in one write: status line, Server and Date, the ready header lines head, then body
+            :param head: header lines as bytes, including Content-Length
+            """
+            self.responseCode = code
+            self.responseLength = str(len(body))
+            self.requestCount += 1
+            if self.request_version == 'HTTP/0.9':
+                self.wfile.write(body)
+                return
+            parts = [status_line(self.protocol_version, code, self.version_string()), date_line(), head]
+            if self.server.keepAlive and self.server.maxRequests and self.requestCount >= self.server.maxRequests:
+                parts.append(b'Connection: close\r\n')
+                self.close_connection = True
+            parts.append(b'\r\n')
+            parts.append(body)
+            self.wfile.write(b''.join(parts))
+
+        def end_headers(self):
+            if self.server.keepAlive:
+                # frame every response so that the connection can carry the next request
+                if (not self.sentLength and self.command != 'HEAD' and
+                        self.responseCode >= 200 and self.responseCode not in (204, 304)):
+                    self.send_header("Content-Length", "0")
+                if self.server.maxRequests and self.requestCount >= self.server.maxRequests:
+                    self.send_header("Connection", "close")
+            BaseHTTPRequestHandler.end_headers(self)
+
         # Headers only request
         def do_HEAD(self):
-            print("Headers: ")
-            sys.stdout.flush()
+            self.log_debug("Headers: %s", self.headers)
 
-            # construct path "mockdir/path/to/resource/headers.json"
-            rfile = "headers.json"
-            rpath = clean_path(self.path, self.server.shortForm)
-            apath = self.server.mockDir
-            fpath = os.path.join(apath, rpath, rfile)
+            # find "mockdir/path/to/resource/headers.json"
+            rpath = clean_path(self.path, self.instance.shortForm)
+            apath = self.instance.mockDir
+            resource = self.get_resource(rpath)
+            self.lap('resolve')
 
             if self.server.timefromJson:
                 responseTime = self.getResponseTime('HEAD', apath, rpath)
                 try:
-                    time.sleep(float(responseTime))
+                    self.delay(float(responseTime))
                 except ValueError as e:
-                    print("Time is not a float value. Sleeping with default response time")
-                    time.sleep(float(self.server.responseTime))
-
-            sys.stdout.flush()
-            print(self.server.headers)
+                    logger.warning("Time is not a float value. Sleeping with default response time")
+                    self.delay(float(self.default_time('HEAD')))
+            elif 'HEAD' in self.server.methodTimes:
+                self.delay(self.server.methodTimes['HEAD'])
 
             # If bool headers is true and headers.json exists...
-            if self.server.headers and (os.path.isfile(fpath)):
+            if self.server.headers and resource.headers is not None:
                 self.send_response(200)
-                with open(fpath) as headers_data:
-                    d = json.load(headers_data)
+                d = resource.headers
                 if isinstance(d["GET"], dict):
                     for k, v in d["GET"].items():
                         if k.lower() not in dont_send:
                             self.send_header(k, v)
+                self.lap('lookup')
                 self.end_headers()
-            elif (self.server.headers is False) or (os.path.isfile(fpath) is False):
+            elif (self.server.headers is False) or resource.headers is None:
                 self.send_response(200)
                 self.send_header("Content-Type", "application/json")
                 self.send_header("OData-Version", "4.0")
+                self.lap('lookup')
                 self.end_headers()
             else:
                 self.send_response(404)
+                self.lap('lookup')
                 self.end_headers()
+            self.lap('write')
 
         def do_GET(self):
             # for GETs always dump the request headers to the console
             # there is no request data, so no need to dump that
-            print("   GET: Headers: {}".format(self.headers))
-            sys.stdout.flush()
-            # specify headers to not send (use lowercase)
-            rfile = "index.json"
-            rfileXml = "index.xml"
-            rhfile = "headers.json"
-
+            self.log_debug("   GET: Headers: %s", self.headers)
+            if self.server.metrics is not None and self.path.split('?', 1)[0] == metrics_path:
+                return self.send_metrics()
             # construct path "mockdir/path/to/resource/<filename>"
             # this is the resource path
-            rpath = clean_path(self.path, self.server.shortForm)
+            rpath = clean_path(self.path, self.instance.shortForm)
             # this is the real absolute path to the mockup directory
-            apath = self.server.mockDir
+            apath = self.instance.mockDir
             # form the path in the mockup of the file
             #      old only support mockup in CWD:  apath=os.path.abspath(rpath)
-            fpath = os.path.join(apath, rpath, rfile)
-            fhpath = os.path.join(apath, rpath, rhfile)
-            fpathxml = os.path.join(apath, rpath, rfileXml)
-            fpathdirect = os.path.join(apath, rpath)
+            fpath = os.path.join(apath, rpath, 'index.json')
+            # index.json, headers.json, index.xml or the direct file, from the preloaded index or disk
+            resource = self.get_resource(rpath)
 
             scheme, netloc, path, params, query, fragment = urlparse(self.path)
             query_pieces = parse_qs(query, keep_blank_values=True)
+            self.lap('resolve')
 
             # get the testEtagFlag and mockup directory path parameters passed in from the http server
             testEtagFlag = self.server.testEtagFlag
 
+            try:
+                expand = expand_query(query_pieces)
+                rfilter = RfFilter(query_pieces['$filter'][0]) if '$filter' in query_pieces else None
+                select = parse_select(query_pieces['$select'][0]) if '$select' in query_pieces else None
+            except (ValueError, RfQueryError) as e:
+                self.send_error(400, str(e))
+                return
+
+            # serialized responses are reused unless the request pages through, filters or projects Members
+            cache, key = self.instance.responseCache, fpath
+            if expand is not None:
+                cache, key = self.instance.expandCache, (fpath,) + expand
+            if any(name in query_pieces for name in ('$top', '$skip', '$filter', '$select')):
+                cache = None
+            cached = cache.get(key) if cache is not None else None
+            if cache is not None and self.server.metrics is not None:
+                self.server.metrics.count('cache_hit' if cached is not None else 'cache_miss')
+            self.lap('lookup')
+
             if self.server.timefromJson:
                 responseTime = self.getResponseTime('GET', apath, rpath)
                 try:
-                    time.sleep(float(responseTime))
+                    self.delay(float(responseTime))
                 except ValueError as e:
-                    print("Time is not a float value. Sleeping with default response time.")
-                    time.sleep(float(self.server.responseTime))
+                    logger.warning("Time is not a float value. Sleeping with default response time.")
+                    self.delay(float(self.default_time('GET')))
+            elif 'GET' in self.server.methodTimes:
+                self.delay(self.server.methodTimes['GET'])
 
             # handle resource paths that don't exist for shortForm
             # '/' and '/redfish'
-            if(self.path == '/' and self.server.shortForm):
+            if(self.path == '/' and self.instance.shortForm):
                 self.send_response(404)
                 self.end_headers()
 
-            elif(self.path in ['/redfish', '/redfish/'] and self.server.shortForm):
+            elif(self.path in ['/redfish', '/redfish/'] and self.instance.shortForm):
+                encoded_data = self.instance.rewrite(json.dumps({'v1': '/redfish/v1'}, indent=4).encode())
                 self.send_response(200)
+                self.send_header("Content-Length", str(len(encoded_data)))
                 self.end_headers()
-                self.wfile.write(json.dumps({'v1': '/redfish/v1'}, indent=4).encode())
+                self.wfile.write(encoded_data)
 
             # if this location exists in memory or as file
-            elif(os.path.isfile(fpath) or fpath in patchedLinks):
-                # if patchedLink is not deleted, else 404
-                # fallthrough case: will be 200 for files too
-                self.send_response(200 if patchedLinks.get(fpath) != '404' else 404)
+            elif(cached is not None or fpath in self.instance.links or resource.body is not None):
+                if cached is None:
+                    token = cache.begin() if cache is not None else None
+                    if expand is None:
+                        cached = self.build_response(fpath, resource, query_pieces, path, rfilter=rfilter, select=select)
+                        if cache is not None:
+                            cache.put(key, token, cached)
+                    else:
+                        # the links found are kept only if nothing changed meanwhile, as the response
+                        paths = {fpath}
+                        self.expandToken = token
+                        cached = self.build_response(fpath, resource, query_pieces, path, expand, paths, rfilter, select)
+                        if cache is not None:
+                            cache.put(key, token, cached, paths)
+                    self.lap('serialize')
 
                 # special cases to test etag for testing
                 # if etag is returned then the patch to these resources should include this etag
-                if testEtagFlag:
-                        if(self.path == "/redfish/v1/Systems/1"):
-                                self.send_header("Etag", "W/\"12345\"")
-                        elif(self.path == "/redfish/v1/AccountService/Accounts/1"):
-                                self.send_header("Etag", "\"123456\"")
-
-                # if headers exist... send information (except for chunk info)
-                # end headers here (always end headers after response)
-                if self.server.headers and (os.path.isfile(fhpath)):
-                    with open(fhpath) as headers_data:
-                        d = json.load(headers_data)
-                    if isinstance(d["GET"], dict):
-                        for k, v in d["GET"].items():
-                            if k.lower() not in dont_send:
-                                self.send_header(str(k), str(v))
-                elif (os.path.isfile(fhpath) is False):
-                    self.send_header("Content-Type", "application/json")
-                    self.send_header("OData-Version", "4.0")
-                self.end_headers()
-
-                # then grab output from file or patchedLinks
-                if fpath not in patchedLinks:
-                    f = open(fpath, "r")
-                    json_obj = json.loads(f.read())
-                    output_data = json_obj
-                    f.close()
+                body, head, etag, etagLine = cached.body, cached.head, cached.etag, cached.etagLine
+                self.lap('lookup')
+                encoding = choose_encoding(self.headers.get('Accept-Encoding')) if self.server.compress else None
+                if encoding is not None and len(body) >= compress_min:
+                    body, head, etagLine = cached.encoded(encoding)
+                    self.lap('compress')
+                if testEtagFlag and self.path in test_etags:
+                    etag, etagLine = test_etags[self.path], test_etag_lines[self.path]
+                if etag is not None and self.server.etags and etag_matches(self.headers.get('If-None-Match'), etag):
+                    # the client has this version already
+                    self.send_whole(304, etagLine, b'')
                 else:
-                    if patchedLinks[fpath] not in [None, '404']:
-                        output_data = patchedLinks[fpath]
-                    else:
-                        output_data = {}
-
-                # Strip the @Redfish.Copyright property
-                output_data.pop("@Redfish.Copyright", None)
-
-                if output_data.get('Members') is not None:
-                    my_members = output_data['Members']
-                    top_count = int(query_pieces.get('$top', [str(len(my_members))])[0])
-                    top_skip = int(query_pieces.get('$skip', ['0'])[0])
-
-                    my_members = my_members[top_skip:]
-                    if top_count < len(my_members):
-                        my_members = my_members[:top_count]
-                        query_out = {'$skip': top_skip + top_count, '$top': top_count}
-                        query_string = '&'.join(['{}={}'.format(k, v) for k, v in query_out.items()])
-                        output_data['Members@odata.nextLink'] = urlunparse(('', '', path, '', query_string, ''))
-                    else:
-                        pass
-
-                    output_data['Members'] = my_members
-                    pass
-
-                encoded_data = json.dumps(output_data, sort_keys=True, indent=4, separators=(",", ": ")).encode()
-                self.wfile.write(encoded_data)
+                    # the header lines of the resource (headers.json, except for chunk info) were built with the body
+                    self.send_whole(cached.status, etagLine + head, body)
+                self.lap('write')
 
             # if XML...
-            elif(os.path.isfile(fpathxml) or os.path.isfile(fpathdirect)):
-                if os.path.isfile(fpathxml):
+            elif(resource.xmlPath is not None or resource.filePath is not None):
+                if resource.xmlPath is not None:
                     file_extension = 'xml'
-                    f = open(fpathxml, "r")
-                elif os.path.isfile(fpathdirect):
-                    filename, file_extension = os.path.splitext(fpathdirect)
-                    f = open(fpathdirect, "r")
-                self.send_response(200)
-                self.send_header("Content-Type", "application/" + file_extension + ";odata.metadata=minimal;charset=utf-8")
-                self.end_headers()
-                self.wfile.write(f.read().encode())
-                f.close()
+                    filePath = resource.xmlPath
+                else:
+                    filename, file_extension = os.path.splitext(resource.filePath)
+                    filePath = resource.filePath
+                encoding = choose_encoding(self.headers.get('Accept-Encoding')) if self.server.compress else None
+                # the file is sent as it is on disk or in the pack, the kernel copies it to the socket
+                f, offset, size, mtime = open_mockup_file(filePath)
+                with f:
+                    lastModified = self.date_time_string(mtime // 1000000000)
+                    etag = '"{:x}-{:x}"'.format(mtime, size) if self.server.etags else None
+                    if self.not_modified(etag, mtime / 1e9):
+                        self.send_response(304)
+                        self.send_header("Last-Modified", lastModified)
+                        if etag is not None:
+                            self.send_header("ETag", etag)
+                        self.lap('lookup')
+                        self.end_headers()
+                        self.lap('write')
+                        return
+                    encoded_data = None
+                    if encoding is not None and size >= compress_min:
+                        encoded_data = compressed_file(filePath, encoding)
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/" + file_extension + ";odata.metadata=minimal;charset=utf-8")
+                    self.send_header("Last-Modified", lastModified)
+                    if etag is not None:
+                        self.send_header("ETag", etag if encoded_data is None else 'W/' + etag)
+                    if self.server.compress:
+                        self.send_header("Vary", "Accept-Encoding")
+                    if encoded_data is not None:
+                        self.send_header("Content-Encoding", encoding)
+                    self.send_header("Content-Length", str(len(encoded_data) if encoded_data is not None else size))
+                    self.lap('lookup')
+                    self.end_headers()
+                    if encoded_data is not None:
+                        self.wfile.write(encoded_data)
+                    else:
+                        self.send_file(f, size, offset)
+                self.lap('write')
             else:
                 self.send_response(404)
+                self.lap('lookup')
                 self.end_headers()
+                self.lap('write')
 
         def do_PATCH(self):
-                print("   PATCH: Headers: {}".format(self.headers))
-                responseTime = self.server.responseTime
-                time.sleep(responseTime)
+                self.log_debug("   PATCH: Headers: %s", self.headers)
+                responseTime = self.default_time('PATCH')
+                self.delay(responseTime)
 
                 if("content-length" in self.headers):
                     lenn = int(self.headers["content-length"])
                     dataa = json.loads(self.rfile.read(lenn).decode("utf-8"))
-                    print("   PATCH: Data: {}".format(dataa))
+                    self.log_debug("   PATCH: Data: %s", dataa)
 
                     # construct path "mockdir/path/to/resource/<filename>"
-                    rpath = clean_path(self.path, self.server.shortForm)
-                    apath = self.server.mockDir    # this is the real absolute path to the mockup directory
+                    rpath = clean_path(self.path, self.instance.shortForm)
+                    apath = self.instance.mockDir    # this is the real absolute path to the mockup directory
                     fpath = os.path.join(apath, rpath, 'index.json')
+                    self.lap('resolve')
 
                     # check if resource exists, otherwise 404
                     #   if it's a file, open it, if its in memory, grab it
@@ -265,35 +2136,55 @@ class RfMockupServer(BaseHTTPRequestHandler):
                     #   204 if patch success
                     #   404 if payload DNE
                     # end headers
-                    success, jsonData = get_cached_link(fpath)
-                    if success:
-                        # If this is a collection, throw a 405
-                        if jsonData.get('Members') is not None:
-                            self.send_response(405)
+                    # with --etags a PATCH carrying If-Match only applies to the version it names
+                    ifMatch = self.headers.get('If-Match') if self.server.etags else None
+                    with self.instance.lock:
+                        success, jsonData = get_cached_link(fpath, self.instance.links)
+                        self.lap('lookup')
+                        if success:
+                            if ifMatch is not None and not etag_matches(ifMatch, self.current_etag(fpath, rpath)):
+                                self.send_response(412)
+                            # If this is a collection, throw a 405
+                            elif jsonData.get('Members') is not None:
+                                self.send_response(405)
+                            else:
+                                # After getting resource, merge the data.
+                                stored = self.instance.links.get(fpath)
+                                if stored is None or isinstance(stored, ResourceOverlay):
+                                    # keep only the changes over the mockup resource
+                                    stored = ResourceOverlay(merged(stored.delta if stored is not None else {}, dataa))
+                                else:
+                                    # a POSTed resource has nothing under it, it is changed as a whole
+                                    stored = merged(stored, dataa)
+                                self.log_debug("   PATCH: Merged: %s", stored)
+                                # put into self.instance.links
+                                try:
+                                    self.instance.links[fpath] = stored
+                                except RfStoreFull as e:
+                                    logger.warning("   PATCH: %s", e)
+                                    self.send_response(507)
+                                else:
+                                    self.invalidate(fpath)
+                                    self.lap('merge')
+                                    self.send_response(204)
                         else:
-                            # After getting resource, merge the data.
-                            print(self.headers.get('content-type'))
-                            print(dataa)
-                            print(jsonData)
-                            dict_merge(jsonData, dataa)
-                            print(jsonData)
-                            # put into patchedLinks
-                            patchedLinks[fpath] = jsonData
-                            self.send_response(204)
-                    else:
-                        self.send_response(404)
+                            self.send_response(404)
+                else:
+                    # nothing to merge
+                    self.send_response(400)
 
                 self.end_headers()
+                self.lap('write')
 
         def do_PUT(self):
-                print("   PUT: Headers: {}".format(self.headers))
-                responseTime = self.server.responseTime
-                time.sleep(responseTime)
+                self.log_debug("   PUT: Headers: %s", self.headers)
+                responseTime = self.default_time('PUT')
+                self.delay(responseTime)
 
                 if("content-length" in self.headers):
                     lenn = int(self.headers["content-length"])
                     dataa = json.loads(self.rfile.read(lenn).decode("utf-8"))
-                    print("   PUT: Data: {}".format(dataa))
+                    self.log_debug("   PUT: Data: %s", dataa)
 
                 # we don't support this service
                 #   405
@@ -303,76 +2194,81 @@ class RfMockupServer(BaseHTTPRequestHandler):
                 self.end_headers()
 
         def do_POST(self):
-                print("   POST: Headers: {}".format(self.headers))
+                self.log_debug("   POST: Headers: %s", self.headers)
+                if self.path.split('?', 1)[0] == reset_path and self.local_client():
+                    return self.reset_state()
                 if("content-length" in self.headers):
                         lenn = int(self.headers["content-length"])
                         dataa = json.loads(self.rfile.read(lenn).decode("utf-8"))
-                        print("   POST: Data: {}".format(dataa))
-                responseTime = self.server.responseTime
-                time.sleep(responseTime)
+                        self.log_debug("   POST: Data: %s", dataa)
+                responseTime = self.default_time('POST')
+                self.delay(responseTime)
 
                 # construct path "mockdir/path/to/resource/<filename>"
-                rpath = clean_path(self.path, self.server.shortForm)
-                apath = self.server.mockDir    # this is the real absolute path to the mockup directory
+                rpath = clean_path(self.path, self.instance.shortForm)
+                apath = self.instance.mockDir    # this is the real absolute path to the mockup directory
                 fpath = os.path.join(apath, rpath, 'index.json')
 
                 xpath = rpath.rstrip('/')
+                self.lap('resolve')
 
                 # don't bother if this item exists, otherwise, check if its an action or a file
                 # if file
                 #   405 if not Collection
                 #   204 if success
                 #   404 if no file present
-                if os.path.isfile(fpath) or patchedLinks.get(fpath) is not None:
-                    success, jsonData = get_cached_link(fpath)
-                    if success:
-                        if jsonData.get('Members') is None:
-                            self.send_response(405)
+                if mockup_isfile(fpath) or fpath in self.instance.links:
+                    with self.instance.lock:
+                        success, jsonData, stored = stored_collection(fpath, self.instance.links)
+                        self.lap('lookup')
+                        if success:
+                            if jsonData.get('Members') is None:
+                                self.send_response(405)
+                            else:
+                                # with members, form unique ID
+                                #   must NOT exist in Members
+                                #   add ID to members, change count
+                                #   store as necessary in self.instance.links
+                                members = jsonData.get('Members')
+                                if not isinstance(members, MemberCollection):
+                                    members = MemberCollection(members)
+                                number = members.allocate('/{}/'.format(xpath))
+                                newpath = '/{}/{}'.format(xpath, number)
+
+                                newfpath = os.path.join(newpath, 'index.json')
+                                newfpath = apath + newfpath
+
+                                if self.instance.shortForm:
+                                    newfpath = newfpath.replace('redfish/v1/', '')
+
+                                self.log_debug("   POST: Created: %s", newfpath)
+
+                                changes = {newfpath: dataa}
+                                if not stored:
+                                    # the first change stores the collection, later ones only journal their edit
+                                    changes[fpath] = jsonData
+                                try:
+                                    self.instance.links.update(changes, (), {fpath: {'add': newpath, 'nextId': number + 1}})
+                                except RfStoreFull as e:
+                                    logger.warning("   POST: %s", e)
+                                    self.send_response(507)
+                                else:
+                                    self.invalidate(fpath, newfpath)
+                                    self.lap('merge')
+                                    self.send_response(204)
+                                    self.send_header("Location", self.instance.prefix + newpath)
+                                    self.send_header("Content-Length", "0")
                         else:
-                            print(dataa)
-                            print(type(dataa))
-                            # with members, form unique ID
-                            #   must NOT exist in Members
-                            #   add ID to members, change count
-                            #   store as necessary in patchedLinks
-                            members = jsonData.get('Members')
-                            n = 1
-                            newpath = '/{}/{}'.format(xpath, len(members) + n)
-                            while newpath in [m.get('@odata.id') for m in members]:
-                                n = n + 1
-                                newpath = '/{}/{}'.format(xpath, len(members) + n)
-                            members.append({'@odata.id': newpath})
-
-                            jsonData['Members'] = members
-                            jsonData['Members@odata.count'] = len(members)
-
-                            newfpath = os.path.join(newpath, 'index.json')
-                            newfpath = apath + newfpath
-
-                            print(newfpath)
-
-                            if self.server.shortForm:
-                                newfpath = newfpath.replace('redfish/v1/', '')
-
-                            print(newfpath)
-
-                            patchedLinks[newfpath] = dataa
-                            patchedLinks[fpath] = jsonData
-                            self.send_response(204)
-                            self.send_header("Location", newpath)
-                            self.send_header("Content-Length", "0")
-                            self.end_headers()
-                    else:
-                        self.send_response(404)
+                            self.send_response(404)
 
                 # eventing framework
                 else:
                     if 'EventService/Actions/EventService.SubmitTestEvent' in rpath:
                         eventpath = os.path.join(apath, 'redfish/v1/EventService/Subscriptions', 'index.json')
-                        if self.server.shortForm:
+                        if self.instance.shortForm:
                             eventpath = eventpath.replace('redfish/v1/', '')
-                        success, jsonData = get_cached_link(eventpath)
-                        print(eventpath)
+                        success, jsonData = get_cached_link(eventpath, self.instance.links)
+                        self.log_debug("   POST: Subscriptions: %s", eventpath)
                         if not success:
                             # Eventing not supported
                             self.send_response(404)
@@ -390,22 +2286,18 @@ class RfMockupServer(BaseHTTPRequestHandler):
                                 dataa['OriginOfCondition']['@odata.id'] = origin_of_cond
 
                                 # Go through each subscriber
-                                print(jsonData.get('Members'))
                                 for member in jsonData.get('Members', []):
                                     entry = member['@odata.id']
-                                    if self.server.shortForm:
+                                    if self.instance.shortForm:
                                         entry = entry.replace('redfish/v1/', '')
                                     entrypath = os.path.join(apath + entry, 'index.json')
-                                    success, jsonData = get_cached_link(entrypath)
-                                    print(apath)
-                                    print(entrypath)
+                                    success, jsonData = get_cached_link(entrypath, self.instance.links)
                                     if not success:
-                                        print('No such resource')
+                                        logger.warning('No such resource %s', entrypath)
                                     else:
                                         # Sanity check the subscription for required properties
                                         if ('Destination' in jsonData) and ('EventTypes' in jsonData):
-                                            print('Target', jsonData['Destination'])
-                                            print(dataa['EventType'], jsonData['EventTypes'])
+                                            self.log_debug('Target %s %s %s', jsonData['Destination'], dataa['EventType'], jsonData['EventTypes'])
 
                                             # If the EventType in the request is one of interest to the subscriber, build an event payload
                                             if dataa['EventType'] in jsonData['EventTypes']:
@@ -416,69 +2308,84 @@ class RfMockupServer(BaseHTTPRequestHandler):
                                                 event_payload['Context'] = jsonData.get('Context', 'Default Context')
                                                 event_payload['Events'] = []
                                                 event_payload['Events'].append(dataa)
-                                                http_headers = {}
-                                                http_headers['Content-Type'] = 'application/json'
-
-                                                # Send the event
-                                                try:
-                                                    r = requests.post(jsonData['Destination'], timeout=20, data=json.dumps(event_payload), headers=http_headers)
-                                                    print('post complete', r.status_code)
-                                                except Exception as e:
-                                                    print('post error', str(e))
+
+                                                # Queue the event, the dispatcher sends it in the background
+                                                if not self.server.eventDispatcher.submit(jsonData['Destination'], event_payload):
+                                                    logger.warning('event queue full, event dropped')
                                             else:
-                                                print('event not in eventtypes')
-                                    sys.stdout.flush()
+                                                self.log_debug('event not in eventtypes')
                                 self.send_response(204)
                                 self.event_id = self.event_id + 1
                     else:
                         self.send_response(405)
 
                 self.end_headers()
+                self.lap('write')
 
         def do_DELETE(self):
                 """
                 Delete a resource
                 """
-                print("DELETE: Headers: {}".format(self.headers))
+                self.log_debug("DELETE: Headers: %s", self.headers)
                 if("content-length" in self.headers):
+                        # the payload is ignored, but it must be consumed for the next request on the connection
+                        lenn = int(self.headers["content-length"])
+                        self.rfile.read(lenn)
                         dataa = {}
-                        print("   POST: Data: {}".format(dataa))
+                        self.log_debug("   DELETE: Data: %s", dataa)
 
-                responseTime = self.server.responseTime
-                time.sleep(responseTime)
+                responseTime = self.default_time('DELETE')
+                self.delay(responseTime)
 
                 # construct path
                 # xpath is URI as related to redfish @odata.id
-                rpath = clean_path(self.path)
+                rpath = clean_path(self.path, False)
                 xpath = '/' + rpath
-                if self.server.shortForm:
+                if self.instance.shortForm:
                     rpath = rpath.replace('redfish/v1/', '')
                     rpath = rpath.replace('redfish/v1', '')
-                apath = self.server.mockDir    # this is the real absolute path to the mockup directory
+                apath = self.instance.mockDir    # this is the real absolute path to the mockup directory
                 fpath = os.path.join(apath, rpath, 'index.json')
 
                 parentpath = os.path.join(apath, rpath.rsplit('/', 1)[0], 'index.json')
+                self.lap('resolve')
 
                 # 404 if file doesn't exist
                 # 204 if success, override payload with 404
                 #   modify payload to exclude expected URI, subtract count
                 # 405 if parent is not Collection
                 # end headers
-                success, jsonData = get_cached_link(fpath)
-                if success:
-                    success, parentData = get_cached_link(parentpath)
-                    if success and parentData.get('Members') is not None:
-                        patchedLinks[fpath] = '404'
-                        parentData['Members'] = [x for x in parentData['Members'] if not x['@odata.id'] == xpath]
-                        parentData['Members@odata.count'] = len(parentData['Members'])
-                        patchedLinks[parentpath] = parentData
-                        self.send_response(204)
+                with self.instance.lock:
+                    success, jsonData = get_cached_link(fpath, self.instance.links)
+                    if success:
+                        success, parentData, stored = stored_collection(parentpath, self.instance.links)
+                        self.lap('lookup')
+                        if success and parentData.get('Members') is not None:
+                            # the first change stores the collection, later ones only journal their edit
+                            changes = {} if stored else {parentpath: parentData}
+                            edits = {parentpath: {'remove': xpath}}
+                            try:
+                                if self.get_resource(rpath, False).body is not None:
+                                    # the mockup file stays, mark it deleted
+                                    changes[fpath] = '404'
+                                    self.instance.links.update(changes, (), edits)
+                                else:
+                                    # a POSTed or generated member leaves nothing behind
+                                    self.instance.links.update(changes, (fpath,), edits)
+                            except RfStoreFull as e:
+                                logger.warning("DELETE: %s", e)
+                                self.send_response(507)
+                            else:
+                                self.invalidate(fpath, parentpath)
+                                self.lap('merge')
+                                self.send_response(204)
+                        else:
+                            self.send_response(405)
                     else:
-                        self.send_response(405)
-                else:
-                    self.send_response(404)
+                        self.send_response(404)
 
                 self.end_headers()
+                self.lap('write')
 
         # this is currently not used
         def translate_path(self, path):
@@ -503,27 +2410,417 @@ class RfMockupServer(BaseHTTPRequestHandler):
                 path = os.path.join(path, word)
                 return path
 
+        def current_payload(self, fpath, resource):
+                """
+                Payload of a resource as GET answers it: its PATCH/POST/DELETE changes over the mockup files
+                :param fpath: index.json path of the resource
+                :param resource: files of the resource, see get_resource
+                :return: (status, payload); payload is a new dict, its values are shared and must not be changed
+                """
+                # if patchedLink is not deleted, else 404
+                # fallthrough case: will be 200 for files too
+                status = 200 if self.instance.links.get(fpath) != '404' else 404
+
+                # then grab output from file or the PATCH/POST/DELETE changes
+                if fpath not in self.instance.links:
+                    # shallow copy, the paging below must not alter the indexed resource
+                    output_data = dict(resource.body)
+                else:
+                    output_data = self.instance.links.get(fpath)
+                    if isinstance(output_data, ResourceOverlay):
+                        # a new dict, the indexed resource is not changed
+                        output_data = output_data.apply(resource.body)
+                    elif output_data not in [None, '404']:
+                        # shallow copy, the paging below must not alter the stored resource
+                        output_data = dict(output_data)
+                    else:
+                        output_data = {}
+
+                # Strip the @Redfish.Copyright property
+                output_data.pop("@Redfish.Copyright", None)
+                return status, output_data
+
+        def build_response(self, fpath, resource, query_pieces, path, expand=None, paths=None, rfilter=None, select=None):
+                """
+                Serialize the GET response of a resource: its PATCH/POST/DELETE changes over the mockup
+                files, with the Members filtered by $filter and paged by $top/$skip, the properties
+                projected by $select and the links expanded by $expand
+                :param fpath: index.json path of the resource
+                :param resource: files of the resource, see get_resource
+                :param query_pieces: parsed query of the request
+                :param path: request path without the query, for the nextLink
+                :param expand: (kind, levels) of expand_query, None to expand nothing
+                :param paths: set the file paths of the expanded resources are added to
+                :param rfilter: RfFilter of the Members, None to keep all
+                :param select: property paths of parse_select, None to keep all properties
+                :return: CachedResponse
+                """
+                serialized = getattr(resource, 'serialized', None)
+                if (serialized is not None and not query_pieces and not self.server.compactJson
+                        and fpath not in self.instance.links):
+                    # a packed mockup holds the body of the unchanged resource, it is neither parsed nor encoded
+                    serialized = self.instance.rewrite(serialized)
+                    etag = resource_etag(serialized) if self.server.etags else None
+                    head = header_block(resource.headers, self.server.headers)
+                    if self.server.compress:
+                        head += b'Vary: Accept-Encoding\r\n'
+                    return CachedResponse(200, serialized, head, etag)
+
+                status, output_data = self.current_payload(fpath, resource)
+
+                if output_data.get('Members') is not None:
+                    members = output_data['Members']
+                    if not isinstance(members, MemberCollection):
+                        members = MemberCollection(members)
+                    if rfilter is not None:
+                        members = MemberCollection(self.filter_members(members, rfilter))
+                        output_data['Members@odata.count'] = len(members)
+                    top_count = int(query_pieces.get('$top', [str(len(members))])[0])
+                    top_skip = int(query_pieces.get('$skip', ['0'])[0])
+
+                    # only the members of the requested page are built
+                    my_members = members.page(top_skip, top_count)
+                    if top_skip + top_count < len(members):
+                        query_out = {'$skip': top_skip + top_count, '$top': top_count}
+                        # the next page is filtered, projected and expanded as this one
+                        for name in ('$filter', '$select', '$expand'):
+                            if name in query_pieces:
+                                query_out[name] = quote(query_pieces[name][0], safe="$'()*,./:=@~")
+                        query_string = '&'.join(['{}={}'.format(k, v) for k, v in query_out.items()])
+                        output_data['Members@odata.nextLink'] = urlunparse(('', '', path, '', query_string, ''))
+                    else:
+                        pass
+
+                    output_data['Members'] = my_members
+                    pass
+                self.lap('lookup')
+
+                if select is not None and status == 200:
+                    output_data = select_properties(output_data, select)
+
+                if expand is not None and status == 200:
+                    kind, levels = expand
+                    paths = paths if paths is not None else set()
+                    output_data = self.expand_links(output_data, find_links(output_data), kind, levels, [expand_limit], paths, (fpath,))
+                    self.lap('expand')
+
+                if self.server.compactJson:
+                    encoded_data = json.dumps(output_data, sort_keys=True, separators=(",", ":")).encode()
+                else:
+                    encoded_data = json.dumps(output_data, sort_keys=True, indent=4, separators=(",", ": ")).encode()
+                encoded_data = self.instance.rewrite(encoded_data)
+                etag = resource_etag(encoded_data) if self.server.etags and status == 200 else None
+                head = header_block(resource.headers, self.server.headers)
+                if self.server.compress:
+                    # caches between server and client must not hand a compressed body to a client that can't take it
+                    head += b'Vary: Accept-Encoding\r\n'
+                return CachedResponse(status, encoded_data, head, etag)
+
+        def expand_links(self, payload, links, kind, levels, budget, paths, chain):
+                """
+                Replace the references of payload that $expand selects by the resources they name
+                :param payload: a new dict, changed in place along with copies of the containers holding references
+                :param links: references of the payload, see find_links
+                :param kind: '.', '*' or '~', see expand_query
+                :param levels: levels of references to follow from here
+                :param budget: [resources that may still be inlined], shared by the whole response
+                :param paths: set the file paths of the expanded resources are added to
+                :param chain: file paths of the resources expanded into each other down to here
+                :return: payload
+                """
+                copies = {(): payload}
+                for keys, uri, inLinks in links:
+                    if (kind == '.' and inLinks) or (kind == '~' and not inLinks):
+                        continue
+                    if budget[0] <= 0:
+                        break
+                    target = self.expanded_resource(uri, kind, levels - 1, budget, paths, chain)
+                    if target is None:
+                        continue
+                    # copy the containers on the way, the stored payloads are shared
+                    container = payload
+                    for i in range(1, len(keys)):
+                        if keys[:i] not in copies:
+                            child = container[keys[i - 1]]
+                            copies[keys[:i]] = container[keys[i - 1]] = dict(child) if isinstance(child, dict) else list(child)
+                        container = copies[keys[:i]]
+                    container[keys[-1]] = target
+                return payload
+
+        def filter_members(self, members, rfilter):
+                """
+                Members that pass a $filter, judged by the property values of the instance's PropertyIndex
+                :param members: MemberCollection
+                :return: list of the members passing
+                """
+                index = self.instance.propertyIndex
+                token = index.begin()
+                passed = []
+                for member in members.page():
+                    uri = member.get('@odata.id') if isinstance(member, dict) else None
+                    if not isinstance(uri, str):
+                        continue
+                    fpath = self.member_path(uri)
+                    row = index.values(fpath, token, rfilter.properties, lambda: self.resource_payload(fpath, uri))
+                    if row is not None and rfilter.matches(row.get):
+                        passed.append(member)
+                return passed
+
+        def member_path(self, uri):
+                return os.path.join(self.instance.mockDir, clean_path(uri, self.instance.shortForm), 'index.json')
+
+        def resource_payload(self, fpath, uri):
+                """
+                Payload of the resource at uri as GET answers it, see current_payload
+                :param fpath: its index.json path, see member_path
+                :return: payload, or None if it is not a resource of the mockup
+                """
+                resource = self.get_resource(clean_path(uri, self.instance.shortForm))
+                if fpath not in self.instance.links and resource.body is None:
+                    return None
+                status, payload = self.current_payload(fpath, resource)
+                return payload if status == 200 else None
+
+        def expanded_resource(self, uri, kind, levels, budget, paths, chain):
+                """
+                Payload of the resource at uri for $expand, with its own references expanded for the levels left
+                :return: payload, or None if it is not a resource of the mockup, or already expanded in chain
+                """
+                fpath = self.member_path(uri)
+                if fpath in chain:
+                    return None
+                payload = self.resource_payload(fpath, uri)
+                if payload is None:
+                    return None
+                budget[0] -= 1
+                # a generated member changes with its collection
+                paths.update((fpath, os.path.join(os.path.dirname(os.path.dirname(fpath)), 'index.json')))
+                if isinstance(payload.get('Members'), MemberCollection):
+                    payload['Members'] = payload['Members'].page()
+                if levels > 0:
+                    cache = self.instance.expandCache
+                    links = cache.links(fpath, self.expandToken, payload) if cache is not None else find_links(payload)
+                    payload = self.expand_links(payload, links, kind, levels, budget, paths, chain + (fpath,))
+                return payload
+
+        def current_etag(self, fpath, rpath):
+                """
+                ETag a GET of the resource would answer with now, for If-Match
+                """
+                if self.server.testEtagFlag and self.path in test_etags:
+                    return test_etags[self.path]
+                cache = self.instance.responseCache
+                cached = cache.get(fpath) if cache is not None else None
+                if cached is None:
+                    cached = self.build_response(fpath, self.get_resource(rpath), {}, urlparse(self.path).path)
+                return cached.etag
+
+        def not_modified(self, etag, mtime):
+                """
+                True if the request's If-None-Match, or else If-Modified-Since, says the client has the file
+                :param etag: ETag of the file, None without --etags
+                :param mtime: modification time of the file
+                """
+                if 'If-None-Match' in self.headers:
+                    return etag is not None and etag_matches(self.headers['If-None-Match'], etag)
+                since = self.headers.get('If-Modified-Since')
+                if since is None:
+                    return False
+                try:
+                    since = email.utils.parsedate_to_datetime(since).timestamp()
+                except (TypeError, ValueError, IndexError, OverflowError):
+                    return False
+                return int(mtime) <= since
+
+        def send_file(self, f, size, offset=0):
+                """
+                Write size bytes of the open file f, from offset, as the response body
+                """
+                if self.server.asyncDelay or not hasattr(self, 'connection'):
+                    # the response is buffered to be sent whole, see handle_one_request
+                    f.seek(offset)
+                    while size > 0:
+                        chunk = f.read(min(size, 65536))
+                        if not chunk:
+                            break
+                        self.wfile.write(chunk)
+                        size -= len(chunk)
+                else:
+                    # os.sendfile where the platform and socket allow it, else a loop of sends
+                    self.connection.sendfile(f, offset, size)
+
+        def invalidate(self, *fpaths):
+                """
+                Drop cached responses of resources changed by PATCH/POST/DELETE
+                """
+                self.instance.invalidate(*fpaths)
+
+        def local_client(self):
+                return self.client_address[0] in ('127.0.0.1', '::1', '::ffff:127.0.0.1')
+
+        def reset_state(self):
+                """
+                Answer POST /mockup/reset: drop every PATCH/POST/DELETE change, and the journal with them
+                """
+                # any payload is ignored
+                self.rfile.read(int(self.headers.get("content-length", 0)))
+                with self.instance.lock:
+                    self.instance.links.reset()
+                    self.instance.clear_caches()
+                logger.warning("State reset by %s", self.address_string())
+                self.send_response(204)
+                self.end_headers()
+
+        def send_metrics(self):
+                """
+                Answer GET /mockup/metrics: json, or Prometheus text with ?format=prometheus or Accept: text/plain
+                """
+                if not self.local_client():
+                    # the endpoint is not part of the mockup, other clients see nothing there
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                state = dict()
+                for instance in self.server.instances:
+                    for k, v in instance.links.counters().items():
+                        if v is not None:
+                            # the limit applies to each instance, the rest add up
+                            state[k] = v if k == 'limit' else state.get(k, 0) + v
+                extra = {'events': self.server.eventDispatcher.counters(), 'log': self.server.log.counters(), 'state': state}
+                if self.server.httpsContext is not None:
+                    # handshakes and session resumptions of all https ports, whichever port is asked
+                    extra['tls'] = self.server.httpsContext.session_stats()
+                query = parse_qs(urlparse(self.path).query)
+                if query.get('format', [''])[0] == 'prometheus' or 'text/plain' in self.headers.get('Accept', ''):
+                    encoded_data = self.server.metrics.prometheus(extra).encode()
+                    contentType = "text/plain; version=0.0.4; charset=utf-8"
+                else:
+                    encoded_data = json.dumps(self.server.metrics.snapshot(extra), sort_keys=True, indent=4).encode()
+                    contentType = "application/json"
+                self.send_response(200)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(encoded_data)))
+                self.end_headers()
+                self.wfile.write(encoded_data)
+
+        def get_resource(self, rpath, virtual=True):
+                """
+                Files of the resource at rpath, from the preloaded index if there is one
+                :param virtual: if there are none, look for a member generated by the parent collection
+                """
+                if self.instance.resourceIndex is not None:
+                    resource = self.instance.resourceIndex.get(rpath)
+                else:
+                    resource = DiskResource(self.instance.mockDir, rpath)
+                if virtual and rpath and resource.body is None and resource.xmlPath is None and resource.filePath is None:
+                    parent = rpath.rpartition('/')[0]
+                    body = get_virtual_member(os.path.join(self.instance.mockDir, rpath, 'index.json'), self.instance.links,
+                                              lambda path: self.get_resource(parent, False).body)
+                    if body is not None:
+                        resource = MockupResource()
+                        resource.body = body
+                return resource
+
         # Response time calculation Algorithm
         def getResponseTime(self, method, apath, rpath):
-                rfile = "time.json"
-                fpath = os.path.join(apath, rpath, rfile)
                 if not any(x in method for x in ("GET", "HEAD", "POST", "PATCH", "DELETE")):
-                    print("Not a valid method")
+                    logger.warning("Not a valid method")
                     return (0)
 
-                if(os.path.isfile(fpath)):
-                    with open(fpath) as time_data:
-                        d = json.load(time_data)
-                        time_str = method + "_Time"
-                        if time_str in d:
-                            try:
-                                float(d[time_str])
-                            except Exception as e:
-                                print(
-                                    "Time in the json file, not a float/int value. Reading the default time.")
-                                return (self.server.responseTime)
-                            return (float(d[time_str]))
-                return (self.server.responseTime)
+                d = self.get_resource(rpath).times
+                if d is not None:
+                    time_str = method + "_Time"
+                    if time_str in d:
+                        try:
+                            float(d[time_str])
+                        except Exception as e:
+                            logger.warning("Time in the json file, not a float/int value. Reading the default time.")
+                            return (self.default_time(method))
+                        return (float(d[time_str]))
+                return (self.default_time(method))
+
+        def default_time(self, method):
+                """
+                Response time of method when time.json does not give one: --methodTime, else -t
+                """
+                return self.server.methodTimes.get(method, self.server.responseTime)
+
+        def delay(self, seconds):
+                """
+                Delay the response by seconds, plus jitter.  With --asyncDelay the response is
+                held back by the server's LatencyScheduler instead of sleeping in this thread.
+                """
+                seconds = apply_jitter(seconds, self.server.jitter)
+                if seconds <= 0:
+                    return
+                if self.server.asyncDelay:
+                    self.pendingDelay += seconds
+                elif self.phases is None:
+                    time.sleep(seconds)
+                else:
+                    start = time.perf_counter()
+                    time.sleep(seconds)
+                    slept = time.perf_counter() - start
+                    self.phases['delay'] = self.phases.get('delay', 0) + slept
+                    # the sleep is not charged to the phase it interrupted
+                    self.lapStart += slept
+
+
+def check_mockup(mockDir, shortForm):
+    """
+    Exit with an error unless mockDir holds a tall mockup, or a short form one if shortForm
+    """
+    pack = packed_mockups.get(mockDir)
+    if pack is not None:
+        if not (pack.isfile("index.json") if shortForm else pack.isdir("redfish")):
+            print("ERROR: Invalid packed mockup {}--no {} at top. Aborting".format(
+                mockDir, "index.json" if shortForm else "/redfish directory"), file=sys.stderr)
+            sys.stderr.flush()
+            sys.exit(1)
+        return
+    # check that we have a valid tall mockup--with /redfish in mockDir before proceeding
+    if not shortForm:
+        slashRedfishDir = os.path.join(mockDir, "redfish")
+        if os.path.isdir(slashRedfishDir) is not True:
+            print("ERROR: Invalid Mockup Directory {}--no /redfish directory at top. Aborting".format(mockDir), file=sys.stderr)
+            sys.stderr.flush()
+            sys.exit(1)
+
+    if shortForm:
+        if os.path.isdir(mockDir) is not True or os.path.isfile(os.path.join(mockDir, "index.json")) is not True:
+            print("ERROR: Invalid Mockup Directory {}--dir or index.json does not exist".format(mockDir), file=sys.stderr)
+            sys.stderr.flush()
+            sys.exit(1)
+
+
+def instance_specs(mockDir, shortForm, port, instancesFile=None, fleet=0, fleetBy='port'):
+    """
+    Instances to serve, from --instances, --fleet, or the one mockup of -D
+    :return: list of {'Name', 'Dir', 'ShortForm', 'Port', 'Host', 'Prefix'} dicts
+    """
+    if instancesFile is not None:
+        items = load_json_file(instancesFile)
+        if isinstance(items, dict):
+            items = items.get('Instances')
+        if not isinstance(items, list) or not items:
+            print("ERROR: {} holds no list of instances".format(instancesFile), file=sys.stderr)
+            sys.exit(2)
+        specs = []
+        for n, item in enumerate(items):
+            specs.append({'Name': str(item.get('Name', 'bmc{}'.format(n + 1))),
+                          'Dir': os.path.realpath(item['Dir']) if 'Dir' in item else mockDir,
+                          'ShortForm': item.get('ShortForm', shortForm),
+                          'Port': int(item.get('Port', port)),
+                          'Host': item.get('Host'),
+                          'Prefix': item.get('Prefix')})
+        return specs
+    if fleet > 0:
+        return [{'Name': 'bmc{}'.format(n), 'Dir': mockDir, 'ShortForm': shortForm,
+                 'Port': port + n - 1 if fleetBy == 'port' else port,
+                 'Host': 'bmc{}'.format(n) if fleetBy == 'host' else None,
+                 'Prefix': 'bmc{}'.format(n) if fleetBy == 'prefix' else None}
+                for n in range(1, fleet + 1)]
+    return [{'Name': '', 'Dir': mockDir, 'ShortForm': shortForm, 'Port': port, 'Host': None, 'Prefix': None}]
 
 
 def usage(program):
@@ -532,16 +2829,50 @@ def usage(program):
         print("      -L --Load      # <not implemented yet>: load and Dump json read from mockup in pretty format with indent=4")
         print("      -H <IpAddr>   --Host=<IpAddr>    # hostIP, default: 127.0.0.1")
         print("      -p <port>     --port=<port>      # port:  default is 8000")
-        print("      -D <dir>,     --Dir=<dir>        # Path to the mockup directory. It may be relative to CWD")
+        print("      -D <dir>,     --Dir=<dir>        # Path to the mockup directory, or to a mockup packed by rfMockupPack.py. It may be relative to CWD")
         print("      -X,           --headers          # Option to load headers or not from json files")
         print("      -t <delay>    --time=<delayTime> # Delay Time in seconds added to any request. Must be float or int.")
+        print("      --etags                          # Send an ETag with every GET, answer If-None-Match with 304 and check If-Match on PATCH")
         print("      -E            --TestEtag         # etag testing--enable returning etag for certain APIs for testing.  See Readme")
         print("      -T                               # Option to delay response or not.")
         print("      -s            --ssl              # Places server in https, requires a certificate and key")
         print("      --cert <cert>                    # Specify a certificate for ssl server function")
         print("      --key <key>                      # Specify a key for ssl")
+        print("      --sslPort=<port>                 # Also serve the instances of the first port over https on <port>, requires --cert and --key")
+        print("      --ciphers=<list>                 # OpenSSL cipher list allowed for TLS 1.2 connections")
+        print("      --sessionTickets=<n>             # TLS 1.3 session tickets sent after each full handshake, 0 for none, default 2")
         print("      -S            --shortForm        # Apply shortform to mockup (allowing to omit filepath /redfish/v1)")
         print("      -P            --ssdp             # Make mockup ssdp discoverable (by redfish specification)")
+        print("      --ssdpNotify=<sec>               # Seconds between ssdp:alive advertisements with -P, 0 for none, default 900")
+        print("      --ssdpRate=<n>                   # M-SEARCH requests answered per second to each source with -P, 0 for no limit, default 10")
+        print("      --ssdpInterfaces=<ip,...>        # Addresses of the interfaces to answer and advertise on with -P, default the -H address")
+        print("      --preload                        # Read the whole mockup into memory at startup; GET/HEAD no longer touch the disk")
+        print("      --cache                          # Cache serialized GET responses until PATCH/POST/DELETE change them")
+        print("      --compress                       # Send gzip or deflate compressed bodies to clients that accept them")
+        print("      --compactJson                    # Send json bodies without indentation")
+        print("      --keepalive                      # Use HTTP/1.1 persistent connections")
+        print("      --idleTimeout=<sec>              # Close persistent connections idle for <sec> seconds, default 5")
+        print("      --maxRequests=<n>                # Close persistent connections after <n> requests, default unlimited")
+        print("      --asyncDelay                     # Hold delayed responses on a timer instead of sleeping in a worker thread")
+        print("      --jitter=<dist>:<sec>            # Vary response delays: fixed, uniform (+-<sec>) or normal (sd <sec>)")
+        print("      --methodTime=<M>:<sec>[,...]     # Default delay per method, e.g. GET:0.5,PATCH:2; overrides -t")
+        print("      --eventWorkers=<n>               # Threads delivering SubmitTestEvent events, default 4")
+        print("      --eventQueue=<n>                 # Events allowed to wait for delivery before new ones are dropped, default 1000")
+        print("      --eventRetries=<n>               # Delivery retries with exponential backoff, default 3")
+        print("      --logLevel=<level>               # off, error, warning, info (adds the access log) or debug (adds headers and payloads), default debug")
+        print("      --logFile=<file>                 # Append the log to <file> instead of stdout")
+        print("      --logSample=<fraction>           # Log the access and debug lines of only this fraction of requests, default 1")
+        print("      --stateFile=<file>               # Keep PATCH/POST/DELETE changes in a journal, replayed at the next start")
+        print("      --stateLimit=<MB>                # Refuse changes with 507 once the changed resources take <MB> megabytes")
+        print("      --watch                          # Pick up changes to the mockup directory without a restart")
+        print("      --watchInterval=<sec>            # Seconds between checks of the mockup directory for --watch, default 1")
+        print("      --instances=<file>               # Serve the mockups listed in a json file, each with its own state, see Readme")
+        print("      --fleet=<n>                      # Serve <n> instances of the -D mockup, named bmc1..bmc<n>, each with its own state")
+        print("      --fleetBy=<how>                  # Select the --fleet instance by port (<port>..<port>+<n>-1), host or prefix, default port")
+        print("      --metrics                        # Time each request and serve the counters at /mockup/metrics to local clients")
+        print("      --threads=<n>                    # Serve requests concurrently from a pool of <n> worker threads")
+        print("      --asyncio                        # Serve all connections from one asyncio event loop instead of threads")
+        print("      --processes=<n>                  # Fork <n> server processes sharing the listening socket (POSIX only)")
         sys.stdout.flush()
 
 
@@ -555,6 +2886,9 @@ def main(argv):
         sslMode = False
         sslCert = None
         sslKey = None
+        sslPort = None
+        sslCiphers = None
+        sessionTickets = 2
         mockDir = None
         testEtagFlag = False
         responseTime = 0
@@ -562,10 +2896,47 @@ def main(argv):
         headers = False
         shortForm = False
         ssdpStart = False
+        ssdpNotify = None
+        ssdpRate = 10
+        ssdpInterfaces = None
+        workerThreads = 0
+        workerProcesses = 0
+        preload = False
+        cacheResponses = False
+        keepAlive = False
+        idleTimeout = 5
+        maxRequests = 0
+        asyncDelay = False
+        jitter = ('fixed', 0.0)
+        methodTimes = dict()
+        eventWorkers = 4
+        eventQueue = 1000
+        eventRetries = 3
+        metrics = False
+        logLevel = 'debug'
+        logFile = None
+        logSample = 1.0
+        stateFile = None
+        stateLimit = None
+        watchInterval = None
+        instancesFile = None
+        fleet = 0
+        fleetBy = 'port'
+        useAsyncio = False
+        etags = False
+        compressBodies = False
+        compactJson = False
         print("Redfish Mockup Server, version {}".format(tool_version))
         try:
             opts, args = getopt.getopt(argv[1:], "hLTSPsEH:p:D:t:X", ["help", "Load", "shortForm", "ssdp", "ssl", "TestEtag", "headers", "Host=", "Port=", "Dir=",
-                                                                    "time=", "cert=", "key="])
+                                                                    "time=", "cert=", "key=", "threads=", "processes=", "preload", "cache",
+                                                                    "keepalive", "idleTimeout=", "maxRequests=",
+                                                                    "asyncDelay", "jitter=", "methodTime=",
+                                                                    "eventWorkers=", "eventQueue=", "eventRetries=", "metrics",
+                                                                    "logLevel=", "logFile=", "logSample=",
+                                                                    "stateFile=", "stateLimit=", "watch", "watchInterval=",
+                                                                    "instances=", "fleet=", "fleetBy=", "asyncio", "etags", "compress", "compactJson",
+                                                                    "ssdpNotify=", "ssdpRate=", "ssdpInterfaces=", "sslPort=", "ciphers=", "sessionTickets="])
         except getopt.GetoptError:
             # usage()
             print("Error parsing options", file=sys.stderr)
@@ -589,6 +2960,8 @@ def main(argv):
                 mockDirPath = arg
             elif opt in ("-E", "--TestEtag"):
                 testEtagFlag = True
+            elif opt in ("--etags",):
+                etags = True
             elif opt in ("-t", "--time"):
                 responseTime = arg
             elif opt in ("-T"):
@@ -599,10 +2972,88 @@ def main(argv):
                 sslCert = arg
             elif opt in ("--key",):
                 sslKey = arg
+            elif opt in ("--sslPort",):
+                sslPort = int(arg)
+            elif opt in ("--ciphers",):
+                sslCiphers = arg
+            elif opt in ("--sessionTickets",):
+                sessionTickets = int(arg)
             elif opt in ("-S", "--shortForm"):
                 shortForm = True
             elif opt in ("-P", "--ssdp"):
                 ssdpStart = True
+            elif opt in ("--ssdpNotify",):
+                ssdpNotify = float(arg)
+            elif opt in ("--ssdpRate",):
+                ssdpRate = float(arg)
+            elif opt in ("--ssdpInterfaces",):
+                ssdpInterfaces = [ip.strip() for ip in arg.split(',') if ip.strip()]
+            elif opt in ("--preload",):
+                preload = True
+            elif opt in ("--cache",):
+                cacheResponses = True
+            elif opt in ("--compress",):
+                compressBodies = True
+            elif opt in ("--compactJson",):
+                compactJson = True
+            elif opt in ("--keepalive",):
+                keepAlive = True
+            elif opt in ("--idleTimeout",):
+                idleTimeout = float(arg)
+            elif opt in ("--maxRequests",):
+                maxRequests = int(arg)
+            elif opt in ("--asyncDelay",):
+                asyncDelay = True
+            elif opt in ("--jitter",):
+                dist, _, spread = arg.partition(':')
+                if dist not in ('fixed', 'uniform', 'normal'):
+                    print("ERROR: --jitter distribution must be fixed, uniform or normal", file=sys.stderr)
+                    sys.exit(2)
+                jitter = (dist, float(spread or 0))
+            elif opt in ("--methodTime",):
+                for item in arg.split(','):
+                    method, _, seconds = item.partition(':')
+                    methodTimes[method.strip().upper()] = float(seconds)
+            elif opt in ("--eventWorkers",):
+                eventWorkers = int(arg)
+            elif opt in ("--eventQueue",):
+                eventQueue = int(arg)
+            elif opt in ("--eventRetries",):
+                eventRetries = int(arg)
+            elif opt in ("--metrics",):
+                metrics = True
+            elif opt in ("--logLevel",):
+                logLevel = arg.lower()
+                if logLevel not in levels:
+                    print("ERROR: --logLevel must be one of {}".format(', '.join(levels)), file=sys.stderr)
+                    sys.exit(2)
+            elif opt in ("--logFile",):
+                logFile = arg
+            elif opt in ("--logSample",):
+                logSample = float(arg)
+            elif opt in ("--stateFile",):
+                stateFile = os.path.realpath(arg)
+            elif opt in ("--stateLimit",):
+                stateLimit = int(float(arg) * 1048576)
+            elif opt in ("--watch",):
+                watchInterval = watchInterval or 1.0
+            elif opt in ("--watchInterval",):
+                watchInterval = float(arg)
+            elif opt in ("--instances",):
+                instancesFile = arg
+            elif opt in ("--fleet",):
+                fleet = int(arg)
+            elif opt in ("--fleetBy",):
+                fleetBy = arg.lower()
+                if fleetBy not in ('port', 'host', 'prefix'):
+                    print("ERROR: --fleetBy must be port, host or prefix", file=sys.stderr)
+                    sys.exit(2)
+            elif opt in ("--asyncio",):
+                useAsyncio = True
+            elif opt in ("--threads",):
+                workerThreads = int(arg)
+            elif opt in ("--processes",):
+                workerProcesses = int(arg)
             else:
                 print('unhandled option', file=sys.stderr)
                 sys.exit(2)
@@ -622,53 +3073,169 @@ def main(argv):
         mockDir = os.path.realpath(mockDirPath)  # creates real full path including path for CWD to the -D<mockDir> dir path
         print("Serving Mockup in abs real directory path:{}".format(mockDir))
 
-        # check that we have a valid tall mockup--with /redfish in mockDir before proceeding
-        if not shortForm:
-            slashRedfishDir = os.path.join(mockDir, "redfish")
-            if os.path.isdir(slashRedfishDir) is not True:
-                print("ERROR: Invalid Mockup Directory--no /redfish directory at top. Aborting", file=sys.stderr)
-                sys.stderr.flush()
-                sys.exit(1)
-
-        if shortForm:
-            if os.path.isdir(mockDir) is not True or os.path.isfile(os.path.join(mockDir, "index.json")) is not True:
-                print("ERROR: Invalid Mockup Directory--dir or index.json does not exist", file=sys.stderr)
-                sys.stderr.flush()
-                sys.exit(1)
+        specs = instance_specs(mockDir, shortForm, port, instancesFile, fleet, fleetBy)
+        for spec in specs:
+            if spec['Dir'] not in packed_mockups and is_packed_mockup(spec['Dir']):
+                try:
+                    packed_mockups[spec['Dir']] = RfPackedMockup(spec['Dir'])
+                except ValueError as e:
+                    print("ERROR: {}".format(e), file=sys.stderr)
+                    sys.exit(1)
+                print("Serving packed mockup {} of {} files".format(spec['Dir'], len(packed_mockups[spec['Dir']].files)))
+            check_mockup(spec['Dir'], spec['ShortForm'])
 
-        myServer = HTTPServer((hostname, port), RfMockupServer)
+        if workerProcesses > 1 and not hasattr(os, 'fork'):
+            print("ERROR: --processes requires a platform that supports fork", file=sys.stderr)
+            sys.stderr.flush()
+            sys.exit(2)
 
-        if sslMode:
-            print("Using SSL with certfile: {}".format(sslCert))
-            myServer.socket = ssl.wrap_socket(myServer.socket, certfile=sslCert, keyfile=sslKey, server_side=True)
-
-        # save the test flag, and real path to the mockup dir for the handler to use
-        myServer.mockDir = mockDir
-        myServer.testEtagFlag = testEtagFlag
-        myServer.headers = headers
-        myServer.timefromJson = timefromJson
-        myServer.shortForm = shortForm
+        # load before binding the port, so that an open port means the server is ready
+        # with --processes the PATCH/POST/DELETE state is shared by a manager process forked here
+        manager = start_state_manager() if workerProcesses > 1 else None
+        # identical files of all mockups are held once
+        contentPool = ContentPool()
+        indexes = dict()
+        instances = []
+        for spec in specs:
+            name, instanceDir = spec['Name'], spec['Dir']
+            if instanceDir in packed_mockups and instanceDir not in indexes:
+                # a packed mockup is always served from its table, --preload parses it all up front
+                indexes[instanceDir] = PackedIndex(packed_mockups[instanceDir])
+                if preload:
+                    count, seconds, size = indexes[instanceDir].load()
+                    print("Preloaded {} resources in {:.3f} seconds, {} in memory".format(
+                        count, seconds, 'unknown' if size is None else '{:.1f} MB'.format(size / 1048576.0)))
+            elif preload and instanceDir not in indexes:
+                indexes[instanceDir] = MockupIndex(instanceDir, contentPool)
+                count, seconds, size = indexes[instanceDir].load()
+                print("Preloaded {} resources in {:.3f} seconds, {} in memory".format(
+                    count, seconds, 'unknown' if size is None else '{:.1f} MB'.format(size / 1048576.0)))
+            # each instance keeps its changes in a journal of its own
+            journal = stateFile if stateFile is None or len(specs) == 1 else '{}.{}'.format(stateFile, name)
+            links, lock, replayed = open_state_store(journal, stateLimit, instanceDir, manager)
+            if journal is not None:
+                print("State journal {}: {} changed resources, {} journal records replayed".format(journal, len(links), replayed))
+            instances.append(MockupInstance(name, instanceDir, spec['ShortForm'], links, lock, indexes.get(instanceDir),
+                                            ResponseCache(shared=workerProcesses > 1) if cacheResponses else None,
+                                            ExpandCache(shared=workerProcesses > 1) if cacheResponses else None,
+                                            PropertyIndex(shared=workerProcesses > 1), spec['Prefix']))
+        if sum(isinstance(index, MockupIndex) for index in indexes.values()) > 1:
+            print("Preloaded mockups share {distinct} distinct files of {files}".format(**contentPool.counters()))
+
+        if useAsyncio:
+            # delayed responses wait on the event loop, nothing may sleep there
+            asyncDelay = True
+            if workerThreads > 0:
+                print("Note: --threads is not used with --asyncio")
+            workerThreads = 0
+        elif (asyncDelay or sslMode or sslPort is not None) and workerThreads == 0:
+            # delayed responses are resumed on a worker pool, and TLS handshakes must not hold the accept loop
+            workerThreads = 16
+
+        # one listening server per port, all served by one worker pool
+        ports = []
+        for spec in specs:
+            if spec['Port'] not in ports:
+                ports.append(spec['Port'])
+        pool = None
+        if workerThreads > 0:
+            print("Serving with a pool of {} threads".format(workerThreads))
+            pool = WorkerPool(workerThreads)
+        eventDispatcher = RfEventDispatcher(eventWorkers, eventQueue, eventRetries)
+        # each server process keeps its own metrics
+        serverMetrics = RfMockupMetrics() if metrics else None
+        serverLog = RfMockupLog(logLevel, logFile, logSample)
+        serverLog.start()
         try:
-            myServer.responseTime = float(responseTime)
+            responseTime = float(responseTime)
         except ValueError as e:
             print("Enter a integer or float value")
             sys.exit(2)
+        if keepAlive and workerThreads == 0 and not useAsyncio:
+            print("Note: with --keepalive and no --threads, an open connection holds the server until it goes idle")
+
+        sslContext = None
+        if sslMode or sslPort is not None:
+            print("Using SSL with certfile: {}".format(sslCert))
+            sslContext = make_ssl_context(sslCert, sslKey, sslCiphers, sessionTickets)
+        # (port, TLS context, port whose instances it serves): -s makes every port https, --sslPort adds one
+        listeners = [(serverPort, sslContext if sslMode else None, serverPort) for serverPort in ports]
+        if sslPort is not None:
+            listeners.append((sslPort, sslContext, ports[0]))
+        servers = []
+        for serverPort, portContext, instancePort in listeners:
+            if pool is not None:
+                myServer = ThreadPoolHTTPServer((hostname, serverPort), RfMockupServer, workerThreads, pool=pool)
+            else:
+                myServer = TLSHTTPServer((hostname, serverPort), RfMockupServer)
+            # connections are wrapped as they are accepted, or by the event loop with --asyncio
+            myServer.sslContext = portContext
+
+            # the instances served on this port: one by default, the others by Host header or path prefix
+            myServer.instances = instances
+            myServer.instance = None
+            myServer.hosts = dict()
+            myServer.prefixes = dict()
+            for spec, instance in zip(specs, instances):
+                if spec['Port'] != instancePort:
+                    continue
+                if spec['Host']:
+                    myServer.hosts[spec['Host'].lower()] = instance
+                if spec['Prefix']:
+                    myServer.prefixes[spec['Prefix'].strip('/')] = instance
+                if not spec['Host'] and not spec['Prefix']:
+                    if myServer.instance is not None:
+                        print("ERROR: instances {} and {} both serve port {}; give them a Host or Prefix".format(
+                            myServer.instance.name, instance.name, instancePort), file=sys.stderr)
+                        sys.exit(2)
+                    myServer.instance = instance
+            myServer.testEtagFlag = testEtagFlag
+            myServer.etags = etags
+            myServer.compress = compressBodies
+            myServer.compactJson = compactJson
+            myServer.headers = headers
+            myServer.timefromJson = timefromJson
+            myServer.eventDispatcher = eventDispatcher
+            myServer.asyncDelay = asyncDelay
+            myServer.jitter = jitter
+            myServer.methodTimes = methodTimes
+            myServer.keepAlive = keepAlive
+            myServer.idleTimeout = idleTimeout
+            myServer.maxRequests = maxRequests
+            myServer.metrics = serverMetrics
+            myServer.log = serverLog
+            myServer.watchInterval = watchInterval
+            myServer.responseTime = responseTime
+            myServer.asyncio = useAsyncio
+            myServer.httpsContext = sslContext
+            servers.append(myServer)
         # myServer.me="HELLO"
 
         mySDDP = None
         if ssdpStart:
-            # construct path "mockdir/path/to/resource/<filename>"
-            rpath = clean_path('/redfish/v1', myServer.shortForm)
-            # this is the real absolute path to the mockup directory
-            apath = myServer.mockDir
-            # form the path in the mockup of the file
-            #      old only support mockup in CWD:  apath=os.path.abspath(rpath)
-            fpath = os.path.join(apath, rpath, 'index.json')
-            success, item = get_cached_link(fpath)
             protocol = '{}://'.format('https' if sslMode else 'http')
-            mySDDP = RfSDDPServer(item, '{}{}:{}{}'.format(protocol, hostname, port, '/redfish/v1'), hostname)
-
-        print("Serving Redfish mockup on port: {}".format(port))
+            # one responder advertises every instance, each at the location that selects it
+            for spec, instance in zip(specs, instances):
+                # construct path "mockdir/path/to/resource/<filename>"
+                rpath = clean_path('/redfish/v1', instance.shortForm)
+                # form the path in the mockup of the file
+                fpath = os.path.join(instance.mockDir, rpath, 'index.json')
+                success, item = get_cached_link(fpath, instance.links)
+                prefix = '/' + spec['Prefix'].strip('/') if spec['Prefix'] else ''
+                location = '{}{}:{}{}{}'.format(protocol, spec['Host'] or hostname, spec['Port'], prefix, '/redfish/v1')
+                if mySDDP is None:
+                    mySDDP = RfSDDPServer(item, location, hostname, rate=ssdpRate, notifyInterval=ssdpNotify,
+                                          interfaces=ssdpInterfaces)
+                else:
+                    mySDDP.addService(item, location)
+
+        if len(instances) > 1:
+            print("Serving {} mockup instances".format(len(instances)))
+        if useAsyncio:
+            print("Serving with an asyncio event loop")
+        print("Serving Redfish mockup on port: {}".format(', '.join(str(p) for p in ports)))
+        if sslPort is not None:
+            print("Serving Redfish mockup over https on port: {}".format(sslPort))
         sys.stdout.flush()
         try:
             if mySDDP is not None:
@@ -676,12 +3243,32 @@ def main(argv):
                 t2.daemon = True
                 t2.start()
             print('running Server...')
-            myServer.serve_forever()
+            if watchInterval:
+                print("Watching the mockup directory every {} seconds".format(watchInterval))
+                # with --processes each server process watches for its own preload index, see serve_worker
+                watch_mockup(instances, watchInterval, index=workerProcesses <= 1)
+            if workerProcesses > 1:
+                print("Serving with {} processes".format(workerProcesses))
+                sys.stdout.flush()
+                serve_processes(servers, workerProcesses)
+            else:
+                stop_on_sigterm()
+                serve_all(servers)
 
         except KeyboardInterrupt:
             pass
 
-        myServer.server_close()
+        for myServer in servers:
+            myServer.server_close()
+        if mySDDP is not None:
+            mySDDP.stop()
+            print("SSDP: {}".format(mySDDP.counters()))
+        eventDispatcher.stop()
+        # fold the journals into their snapshots so that the next start is quick
+        for instance in instances:
+            instance.links.close()
+        serverLog.stop()
+        print("Event delivery: {}".format(eventDispatcher.counters()))
         print("Shutting down http server")
         sys.stdout.flush()
 
@@ -0,0 +1,129 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+" Background delivery of Redfish events to subscription destinations "
+
+import json
+import queue
+import logging
+import threading
+from urllib.parse import urlparse
+
+import requests
+
+logger = logging.getLogger('rfMockupServer.events')
+
+
+class RfEventDispatcher():
+    def __init__(self, workers=4, queueSize=1000, retries=3, backoff=0.5, timeout=20):
+        """__init__
+
+        Initialize an event dispatcher; worker threads start with the first event
+
+        :param workers: number of delivery threads
+        :param queueSize: events allowed to wait for a worker, further events are dropped
+        :param retries: delivery attempts after the first one fails
+        :param backoff: seconds before the first retry, doubled for each further retry
+        :param timeout: read timeout in seconds for each delivery
+        """
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.queue = queue.Queue(queueSize)
+        self.threads = []
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.stopping = False
+        self.counts = {'submitted': 0, 'delivered': 0, 'failed': 0, 'retried': 0, 'dropped': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def counters(self):
+        """
+        Delivery counters, plus the number of events waiting
+        """
+        with self.lock:
+            counts = dict(self.counts)
+        counts['queued'] = self.queue.qsize()
+        return counts
+
+    def start(self):
+        with self.lock:
+            if self.threads:
+                return
+            for n in range(self.workers):
+                t = threading.Thread(target=self.run, name='rfEvent{}'.format(n))
+                t.daemon = True
+                t.start()
+                self.threads.append(t)
+
+    def submit(self, destination, payload):
+        """
+        Queue an event for delivery without waiting for it
+
+        :param destination: url of the subscriber
+        :param payload: event dict, sent as json
+        :return: False if the queue is full and the event was dropped
+        """
+        self.start()
+        self.count('submitted')
+        return self.enqueue((destination, json.dumps(payload), 0))
+
+    def enqueue(self, item):
+        try:
+            self.queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.count('dropped')
+            return False
+
+    def session(self, destination):
+        # one keep-alive session per destination for each worker thread
+        if not hasattr(self.local, 'sessions'):
+            self.local.sessions = dict()
+        key = urlparse(destination)[:2]
+        if key not in self.local.sessions:
+            self.local.sessions[key] = requests.Session()
+        return self.local.sessions[key]
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            self.deliver(*item)
+
+    def deliver(self, destination, data, attempt):
+        try:
+            r = self.session(destination).post(destination, data=data, timeout=(3.05, self.timeout),
+                                               headers={'Content-Type': 'application/json'})
+            logger.debug('post complete %s %s', destination, r.status_code)
+            if r.status_code < 500:
+                self.count('delivered')
+                return
+        except Exception as e:
+            logger.warning('post error %s %s', destination, e)
+        if attempt < self.retries and not self.stopping:
+            self.count('retried')
+            retry = threading.Timer(self.backoff * 2 ** attempt, self.enqueue, args=((destination, data, attempt + 1),))
+            retry.daemon = True
+            retry.start()
+        else:
+            self.count('failed')
+
+    def stop(self, wait=5):
+        """
+        Stop the workers once the queued events are sent, waiting at most wait seconds each
+        """
+        self.stopping = True
+        for t in self.threads:
+            try:
+                self.queue.put(None, timeout=wait)
+            except queue.Full:
+                break
+        for t in self.threads:
+            t.join(wait)
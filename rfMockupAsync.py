@@ -0,0 +1,171 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+" asyncio engine of the mockup server: all connections on one event loop, answered by the usual request handler "
+
+import io
+import re
+import asyncio
+import logging
+
+logger = logging.getLogger('rfMockupServer')
+
+content_length = re.compile(rb'\r\ncontent-length[ \t]*:[ \t]*(\d+)', re.IGNORECASE)
+expect_continue = re.compile(rb'\r\nexpect[ \t]*:[ \t]*100-continue', re.IGNORECASE)
+
+# a header block this long without its end is handed to the handler as it is, which answers 431
+max_header = 65536 * 2
+
+# connections the kernel queues for the loop to accept, so a burst of crawlers is not made to retry
+listen_backlog = 1024
+
+
+class RfAsyncConnection(asyncio.Protocol):
+    def __init__(self, server):
+        """__init__
+
+        Initialize one client connection
+
+        :param server: the HTTPServer whose settings and RequestHandlerClass answer the requests; its
+            handler must buffer delayed responses (--asyncDelay) so that no request sleeps on the loop
+        """
+        self.server = server
+        self.buffer = bytearray()
+        self.transport = None
+        self.handler = None
+        self.waiting = False        # a delayed response holds back the requests after it
+        self.paused = False         # the client is not reading its responses
+        self.closing = False
+        self.continued = False      # 100 Continue was sent for the request being received
+        self.idle = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        # one handler per connection, reading each request from a buffer and writing its response to another
+        handlerClass = self.server.RequestHandlerClass
+        self.handler = handlerClass.__new__(handlerClass)
+        self.handler.server = self.server
+        self.handler.request = None
+        self.handler.client_address = transport.get_extra_info('peername')
+        # 100 Continue is answered here, before the body arrives
+        self.handler.handle_expect_100 = lambda: True
+        self.handler.setup_connection()
+        self.handler.deferred = False
+        self.start_idle()
+
+    def connection_lost(self, exc):
+        self.closing = True
+        self.stop_idle()
+
+    def data_received(self, data):
+        self.stop_idle()
+        self.buffer += data
+        self.process()
+
+    def pause_writing(self):
+        self.paused = True
+        self.transport.pause_reading()
+
+    def resume_writing(self):
+        self.paused = False
+        self.transport.resume_reading()
+        self.process()
+
+    def start_idle(self):
+        if self.server.idleTimeout:
+            self.idle = asyncio.get_event_loop().call_later(self.server.idleTimeout, self.transport.close)
+
+    def stop_idle(self):
+        if self.idle is not None:
+            self.idle.cancel()
+            self.idle = None
+
+    def process(self):
+        """
+        Answer the complete requests in the buffer, in order
+        """
+        while not (self.waiting or self.paused or self.closing):
+            request = self.next_request()
+            if request is None:
+                break
+            self.answer(request)
+        if not (self.waiting or self.closing) and self.idle is None:
+            self.start_idle()
+
+    def next_request(self):
+        """
+        Take the first complete request, with its body, from the buffer
+        :return: request bytes, or None until more data arrives
+        """
+        end = self.buffer.find(b'\r\n\r\n')
+        if end < 0:
+            if len(self.buffer) <= max_header:
+                return None
+            end = len(self.buffer) - 4
+        head = bytes(self.buffer[:end + 2])
+        match = content_length.search(head)
+        size = end + 4 + (int(match.group(1)) if match is not None else 0)
+        if len(self.buffer) < size:
+            if not self.continued and expect_continue.search(head) is not None:
+                self.continued = True
+                self.transport.write(b'HTTP/1.1 100 Continue\r\n\r\n')
+            return None
+        request = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        self.continued = False
+        return request
+
+    def answer(self, request):
+        handler = self.handler
+        handler.rfile = io.BytesIO(request)
+        handler.wfile = io.BytesIO()
+        # parse_request decides whether the connection stays open, a request it never reaches closes it
+        handler.close_connection = True
+        try:
+            handler.handle_one_request()
+        except Exception:
+            logger.exception("Request from %s failed", handler.client_address[0])
+            handler.deferred = False
+            handler.close_connection = True
+        if handler.deferred:
+            # the response waits on the loop, later requests of this connection wait behind it
+            handler.deferred = False
+            self.waiting = True
+            response, handler.deferredResponse = handler.deferredResponse, None
+            asyncio.get_event_loop().call_later(handler.pendingDelay, self.resume, response)
+        else:
+            self.send(handler.wfile.getvalue())
+
+    def resume(self, response):
+        self.waiting = False
+        if not self.transport.is_closing():
+            self.send(response)
+            self.process()
+
+    def send(self, response):
+        if response:
+            self.transport.write(response)
+        if self.handler.close_connection:
+            self.closing = True
+            self.transport.close()
+
+
+def serve_asyncio(servers):
+    """
+    Serve the listening sockets of servers on one event loop until interrupted; the loop does the TLS
+    handshakes of the servers whose sslContext is set, their sockets themselves are not wrapped
+
+    :param servers: bound and activated HTTPServers, see RfAsyncConnection
+    """
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    listeners = [loop.run_until_complete(loop.create_server(lambda server=server: RfAsyncConnection(server),
+                                                            sock=server.socket, ssl=server.sslContext, backlog=listen_backlog))
+                 for server in servers]
+    try:
+        loop.run_forever()
+    finally:
+        for listener in listeners:
+            listener.close()
+        loop.close()
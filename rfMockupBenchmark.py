@@ -0,0 +1,321 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+# rfMockupBenchmark.py
+# load test for redfishMockupServer.py, reports throughput and latency as json
+
+import sys
+import os
+import getopt
+import json
+import time
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import subprocess
+import http.client
+from urllib.parse import urlparse
+from rfMockupGenerator import MockupGenerator
+
+default_mix = {'GET': 70, 'HEAD': 5, 'PAGE': 10, 'PATCH': 5, 'POST': 5, 'DELETE': 5}
+
+
+def find_resources(mockDir, shortForm):
+    """
+    List the URIs of the json resources of a mockup, and which of them are collections
+    :return: (resources, collections) lists of URIs
+    """
+    resources, collections = [], []
+    for dirpath, dirnames, filenames in os.walk(mockDir):
+        if 'index.json' not in filenames:
+            continue
+        rpath = os.path.relpath(dirpath, mockDir).replace(os.sep, '/')
+        rpath = '' if rpath == '.' else rpath
+        uri = '/redfish/v1/' + rpath if shortForm else '/' + rpath
+        uri = uri.rstrip('/') or '/'
+        try:
+            with open(os.path.join(dirpath, 'index.json')) as f:
+                payload = json.load(f)
+                isCollection = 'Members' in payload or 'Members@Mockup.Template' in payload
+        except ValueError:
+            continue
+        (collections if isCollection else resources).append(uri)
+    return resources, collections
+
+
+def start_server(mockDir, port, shortForm, serverArgs):
+    """
+    Start redfishMockupServer.py on mockDir and wait until it accepts connections
+    :return: (process, seconds until the port accepted a connection)
+    """
+    program = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'redfishMockupServer.py')
+    cmd = [sys.executable, program, '-H', '127.0.0.1', '-p', str(port), '-D', mockDir] + (['-S'] if shortForm else []) + serverArgs
+    start = time.time()
+    proc = subprocess.Popen(cmd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    while time.time() - start < 300:
+        if proc.poll() is not None:
+            raise RuntimeError('server exited with {}'.format(proc.returncode))
+        try:
+            socket.create_connection(('127.0.0.1', port), 0.5).close()
+            return proc, time.time() - start
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError('server did not start')
+
+
+def percentile(ordered, p):
+    if not ordered:
+        return None
+    k = min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))
+    return ordered[k]
+
+
+def summarize(samples, elapsed):
+    ordered = sorted(samples)
+    return {'requests': len(ordered),
+            'requests_per_sec': round(len(ordered) / elapsed, 1) if elapsed else None,
+            'p50_ms': round(percentile(ordered, 50) * 1000, 3) if ordered else None,
+            'p95_ms': round(percentile(ordered, 95) * 1000, 3) if ordered else None,
+            'p99_ms': round(percentile(ordered, 99) * 1000, 3) if ordered else None,
+            'max_ms': round(ordered[-1] * 1000, 3) if ordered else None}
+
+
+class BenchClient(threading.Thread):
+    '''
+    one client connection issuing a random mix of requests until the deadline
+    '''
+    def __init__(self, bench, seed):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.bench = bench
+        self.random = random.Random(seed)
+        self.samples = dict()
+        self.statuses = dict()
+        self.errors = 0
+        self.created = []
+        self.conn = None
+
+    def request(self, method, uri, body=None):
+        data = json.dumps(body) if body is not None else None
+        headers = {'Content-Type': 'application/json'} if data is not None else {}
+        for attempt in (0, 1):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.bench.port, timeout=60)
+            try:
+                self.conn.request(method, uri, body=data, headers=headers)
+                r = self.conn.getresponse()
+                r.read()
+                if r.getheader('Connection', '').lower() == 'close' or r.version == 10:
+                    self.conn.close()
+                    self.conn = None
+                return r
+            except (http.client.HTTPException, OSError):
+                # the server closed an idle or used up connection, retry once on a new one
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def next_request(self):
+        bench = self.bench
+        kind = self.random.choices(bench.kinds, bench.weights)[0]
+        if kind == 'GET':
+            return 'GET', self.random.choice(bench.resources + bench.collections), None
+        if kind == 'HEAD':
+            return 'HEAD', self.random.choice(bench.resources + bench.collections), None
+        if kind == 'PAGE' and bench.collections:
+            return 'PAGE', '{}?$top={}&$skip={}'.format(self.random.choice(bench.collections), 10, self.random.randint(0, 20)), None
+        if kind == 'PATCH' and bench.resources:
+            return 'PATCH', self.random.choice(bench.resources), {'Oem': {'Benchmark': {'Counter': self.random.randint(0, 1 << 30)}}}
+        if kind == 'POST' and bench.collections:
+            return 'POST', self.random.choice(bench.collections), {'Name': 'Benchmark resource'}
+        if kind == 'DELETE' and self.created:
+            # only resources created by this client are deleted, the mockup itself stays intact
+            return 'DELETE', self.created.pop(), None
+        return 'GET', self.random.choice(bench.resources + bench.collections), None
+
+    def run(self):
+        while time.time() < self.bench.deadline:
+            kind, uri, body = self.next_request()
+            method = 'GET' if kind == 'PAGE' else kind
+            start = time.time()
+            try:
+                r = self.request(method, uri, body)
+            except Exception:
+                self.errors += 1
+                continue
+            self.samples.setdefault(kind, []).append(time.time() - start)
+            self.statuses[r.status] = self.statuses.get(r.status, 0) + 1
+            if kind == 'POST' and r.getheader('Location'):
+                self.created.append(urlparse(r.getheader('Location')).path)
+
+
+class Benchmark(object):
+    '''
+    drives a running mockup server with N concurrent clients
+    '''
+    def __init__(self, port, resources, collections, mix):
+        self.port = port
+        self.resources = resources
+        self.collections = collections
+        self.kinds = list(mix.keys())
+        self.weights = list(mix.values())
+        self.deadline = 0
+
+    def run(self, clients, duration, seed=0):
+        self.deadline = time.time() + duration
+        workers = [BenchClient(self, seed + n) for n in range(clients)]
+        start = time.time()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.time() - start
+
+        everything, perKind, statuses, errors = [], dict(), dict(), 0
+        for w in workers:
+            for kind, samples in w.samples.items():
+                perKind.setdefault(kind, []).extend(samples)
+                everything.extend(samples)
+            for status, n in w.statuses.items():
+                statuses[str(status)] = statuses.get(str(status), 0) + n
+            errors += w.errors
+        result = summarize(everything, elapsed)
+        result['elapsed_sec'] = round(elapsed, 3)
+        result['errors'] = errors
+        result['statuses'] = statuses
+        result['by_kind'] = {kind: summarize(samples, elapsed) for kind, samples in sorted(perKind.items())}
+        return result
+
+
+def run_benchmark(mockDir, shortForm, port, clients, duration, mix, serverArgs, systems, depth):
+    """
+    Serve mockDir, or a generated mockup if it is None, and run the benchmark against it
+    :return: report dict
+    """
+    tempDir = None
+    generated = None
+    if mockDir is None:
+        tempDir = tempfile.mkdtemp(prefix='rfMockupBench')
+        mockDir = tempDir
+        shortForm = False
+        generated = MockupGenerator(systems=systems, depth=depth).write(mockDir)[0]
+
+    server = None
+    try:
+        resources, collections = find_resources(mockDir, shortForm)
+        server, startup = start_server(mockDir, port, shortForm, serverArgs)
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        conn.request('GET', '/redfish/v1')
+        serverVersion = conn.getresponse().getheader('Server')
+        conn.close()
+
+        result = Benchmark(port, resources, collections, mix).run(clients, duration)
+        return {'server': serverVersion,
+                'server_args': serverArgs,
+                'mockup': 'synthetic' if tempDir else mockDir,
+                'resources': len(resources) + len(collections),
+                'generated_files': generated,
+                'clients': clients,
+                'duration_sec': duration,
+                'mix': mix,
+                'startup_sec': round(startup, 3),
+                'result': result}
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if tempDir is not None:
+            shutil.rmtree(tempDir, ignore_errors=True)
+
+
+def usage(program):
+        print("usage: {}   [-h][-D <mockupDir>][-S][-c <clients>][-d <seconds>]".format(program))
+        print("      -h --help                        # prints usage ")
+        print("      -D <dir>,     --Dir=<dir>        # Mockup to serve, default: a synthetic mockup")
+        print("      -S            --shortForm        # The mockup is a short form mockup")
+        print("      -p <port>     --port=<port>      # Port for the server under test, default 8010")
+        print("      -c <clients>  --clients=<n>      # Concurrent client connections, default 8")
+        print("      -d <seconds>  --duration=<sec>   # Length of the measured run, default 10")
+        print("      -o <file>     --output=<file>    # Write the json report to <file> instead of stdout")
+        print("      --mix=<KIND>:<weight>[,...]      # Request mix of GET, HEAD, PAGE ($top/$skip), PATCH, POST, DELETE")
+        print("                                       # default " + ','.join('{}:{}'.format(k, v) for k, v in default_mix.items()))
+        print("      --systems=<n>                    # Size of the synthetic Systems collection, default 100")
+        print("      --depth=<n>                      # Depth of the synthetic mockup, see rfMockupGenerator.py, default 2")
+        print("      --scale=<n>[,<n>...]             # Repeat the run on synthetic mockups with each number of systems")
+        print("      --serverArgs=<args>              # Extra redfishMockupServer.py options, e.g. \"--threads=8 --cache\"")
+        sys.stdout.flush()
+
+
+def main(argv):
+        program = argv[0]
+        mockDir = None
+        shortForm = False
+        port = 8010
+        clients = 8
+        duration = 10.0
+        output = None
+        mix = dict(default_mix)
+        systems = 100
+        depth = 2
+        scale = None
+        serverArgs = []
+        try:
+            opts, args = getopt.getopt(argv[1:], "hSD:p:c:d:o:", ["help", "shortForm", "Dir=", "port=", "clients=", "duration=",
+                                                                  "output=", "mix=", "systems=", "depth=", "scale=",
+                                                                  "serverArgs="])
+        except getopt.GetoptError:
+            print("Error parsing options", file=sys.stderr)
+            usage(program)
+            sys.exit(2)
+
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage(program)
+                sys.exit(0)
+            elif opt in ("-D", "--Dir"):
+                mockDir = os.path.realpath(arg)
+            elif opt in ("-S", "--shortForm"):
+                shortForm = True
+            elif opt in ("-p", "--port"):
+                port = int(arg)
+            elif opt in ("-c", "--clients"):
+                clients = int(arg)
+            elif opt in ("-d", "--duration"):
+                duration = float(arg)
+            elif opt in ("-o", "--output"):
+                output = arg
+            elif opt in ("--mix",):
+                mix = {}
+                for item in arg.split(','):
+                    kind, _, weight = item.partition(':')
+                    mix[kind.strip().upper()] = float(weight or 1)
+            elif opt in ("--systems",):
+                systems = int(arg)
+            elif opt in ("--depth",):
+                depth = int(arg)
+            elif opt in ("--scale",):
+                scale = [int(n) for n in arg.split(',')]
+            elif opt in ("--serverArgs",):
+                serverArgs = arg.split()
+
+        if scale is not None:
+            # startup and per request cost against the size of the tree
+            report = {'scale': [run_benchmark(None, False, port, clients, duration, mix, serverArgs, n, depth) for n in scale]}
+        else:
+            report = run_benchmark(mockDir, shortForm, port, clients, duration, mix, serverArgs, systems, depth)
+
+        if output:
+            with open(output, 'w') as f:
+                json.dump(report, f, indent=4, sort_keys=True)
+        else:
+            print(json.dumps(report, indent=4, sort_keys=True))
+
+
+# the below is only executed if the program is run as a script
+if __name__ == "__main__":
+        main(sys.argv)
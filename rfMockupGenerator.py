@@ -0,0 +1,250 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+# rfMockupGenerator.py
+# writes synthetic tall or short form mockups of any size for scale testing
+
+import sys
+import os
+import getopt
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class MockupGenerator(object):
+    '''
+    builds the resources of a synthetic mockup and writes them out in bulk
+    '''
+    def __init__(self, systems=100, chassis=None, managers=1, processors=2, memory=4, logEntries=10, depth=3,
+                 headers=False, times=None, virtualEntries=False):
+        """__init__
+
+        :param systems: members of /redfish/v1/Systems
+        :param chassis: members of /redfish/v1/Chassis, default one per system
+        :param managers: members of /redfish/v1/Managers
+        :param processors: members of each system's Processors collection
+        :param memory: members of each system's Memory collection
+        :param logEntries: members of each system's LogServices/Log/Entries collection
+        :param depth: levels below each system: 1 the system only, 2 adds Processors/Memory/LogServices, 3 adds log entries
+        :param headers: write a headers.json next to every index.json
+        :param times: write a time.json with this response time next to every index.json
+        :param virtualEntries: describe log entries with a Members@Mockup.Template instead of writing them
+        """
+        self.systems = systems
+        self.chassis = systems if chassis is None else chassis
+        self.managers = managers
+        self.processors = processors
+        self.memory = memory
+        self.logEntries = logEntries
+        self.depth = depth
+        self.headers = headers
+        self.times = times
+        self.virtualEntries = virtualEntries
+
+    def collection(self, uri, odataType, name, memberUris):
+        return {'@odata.id': uri, '@odata.type': '#{0}.{0}'.format(odataType), 'Name': name,
+                'Members@odata.count': len(memberUris), 'Members': [{'@odata.id': m} for m in memberUris]}
+
+    def resources(self):
+        """
+        Generate (uri, payload) for every resource of the mockup
+        """
+        root = '/redfish/v1'
+        yield root, {'@odata.id': root, '@odata.type': '#ServiceRoot.v1_5_0.ServiceRoot', 'Id': 'RootService',
+                     'Name': 'Root Service', 'RedfishVersion': '1.6.0', 'UUID': '92384634-2938-2342-8820-489239905423',
+                     'Systems': {'@odata.id': root + '/Systems'}, 'Chassis': {'@odata.id': root + '/Chassis'},
+                     'Managers': {'@odata.id': root + '/Managers'}}
+
+        systems = ['{}/Systems/{}'.format(root, n) for n in range(1, self.systems + 1)]
+        chassis = ['{}/Chassis/{}'.format(root, n) for n in range(1, self.chassis + 1)]
+        managers = ['{}/Managers/{}'.format(root, n) for n in range(1, self.managers + 1)]
+        yield root + '/Systems', self.collection(root + '/Systems', 'ComputerSystemCollection', 'Computer System Collection', systems)
+        yield root + '/Chassis', self.collection(root + '/Chassis', 'ChassisCollection', 'Chassis Collection', chassis)
+        yield root + '/Managers', self.collection(root + '/Managers', 'ManagerCollection', 'Manager Collection', managers)
+
+        for n, uri in enumerate(managers, 1):
+            yield uri, {'@odata.id': uri, '@odata.type': '#Manager.v1_5_0.Manager', 'Id': str(n), 'Name': 'Manager {}'.format(n),
+                        'ManagerType': 'BMC', 'Status': {'State': 'Enabled', 'Health': 'OK'},
+                        'Links': {'ManagerForServers': [{'@odata.id': s} for s in systems[n - 1::self.managers]]}}
+
+        for n, uri in enumerate(chassis, 1):
+            payload = {'@odata.id': uri, '@odata.type': '#Chassis.v1_8_0.Chassis', 'Id': str(n), 'Name': 'Chassis {}'.format(n),
+                       'ChassisType': 'RackMount', 'SerialNumber': 'SN{:08d}'.format(n), 'Status': {'State': 'Enabled', 'Health': 'OK'},
+                       'Links': {'ComputerSystems': []}}
+            if n <= len(systems):
+                payload['Links']['ComputerSystems'].append({'@odata.id': systems[n - 1]})
+            yield uri, payload
+
+        for n, uri in enumerate(systems, 1):
+            payload = {'@odata.id': uri, '@odata.type': '#ComputerSystem.v1_5_0.ComputerSystem', 'Id': str(n),
+                       'Name': 'System {}'.format(n), 'SystemType': 'Physical', 'PowerState': 'On' if n % 4 else 'Off',
+                       'SerialNumber': 'SYS{:08d}'.format(n), 'Status': {'State': 'Enabled', 'Health': 'OK' if n % 10 else 'Warning'},
+                       'Boot': {'BootSourceOverrideEnabled': 'Disabled', 'BootSourceOverrideTarget': 'None'},
+                       'ProcessorSummary': {'Count': self.processors}, 'MemorySummary': {'TotalSystemMemoryGiB': 16 * self.memory},
+                       'Links': {'Chassis': [], 'ManagedBy': [{'@odata.id': managers[(n - 1) % len(managers)]}] if managers else []}}
+            if n <= len(chassis):
+                payload['Links']['Chassis'].append({'@odata.id': chassis[n - 1]})
+            if self.depth >= 2:
+                payload['Processors'] = {'@odata.id': uri + '/Processors'}
+                payload['Memory'] = {'@odata.id': uri + '/Memory'}
+                payload['LogServices'] = {'@odata.id': uri + '/LogServices'}
+            yield uri, payload
+            if self.depth >= 2:
+                for item in self.system_subtree(uri):
+                    yield item
+
+    def system_subtree(self, uri):
+        processors = ['{}/Processors/{}'.format(uri, n) for n in range(1, self.processors + 1)]
+        yield uri + '/Processors', self.collection(uri + '/Processors', 'ProcessorCollection', 'Processors Collection', processors)
+        for n, puri in enumerate(processors, 1):
+            yield puri, {'@odata.id': puri, '@odata.type': '#Processor.v1_3_0.Processor', 'Id': str(n), 'Name': 'Processor',
+                         'Socket': 'CPU {}'.format(n), 'ProcessorType': 'CPU', 'TotalCores': 16, 'TotalThreads': 32,
+                         'Status': {'State': 'Enabled', 'Health': 'OK'}}
+
+        dimms = ['{}/Memory/{}'.format(uri, n) for n in range(1, self.memory + 1)]
+        yield uri + '/Memory', self.collection(uri + '/Memory', 'MemoryCollection', 'Memory Module Collection', dimms)
+        for n, muri in enumerate(dimms, 1):
+            yield muri, {'@odata.id': muri, '@odata.type': '#Memory.v1_6_0.Memory', 'Id': str(n), 'Name': 'DIMM {}'.format(n),
+                         'CapacityMiB': 16384, 'MemoryDeviceType': 'DDR4', 'Status': {'State': 'Enabled', 'Health': 'OK'}}
+
+        logs = uri + '/LogServices'
+        yield logs, self.collection(logs, 'LogServiceCollection', 'Log Service Collection', [logs + '/Log'])
+        yield logs + '/Log', {'@odata.id': logs + '/Log', '@odata.type': '#LogService.v1_1_0.LogService', 'Id': 'Log',
+                              'Name': 'System Log Service', 'MaxNumberOfRecords': max(self.logEntries, 1000),
+                              'OverWritePolicy': 'WrapsWhenFull', 'Entries': {'@odata.id': logs + '/Log/Entries'}}
+        if self.depth >= 3:
+            entries = logs + '/Log/Entries'
+            if self.virtualEntries:
+                # the server generates the members and their payloads from the pattern
+                payload = self.collection(entries, 'LogEntryCollection', 'Log Entries', [])
+                del payload['Members']
+                payload['Members@Mockup.Template'] = {'Pattern': entries + '/{}', 'Start': 1, 'Count': self.logEntries,
+                                                      'Member': self.log_entry(entries + '/{Id}', '{Id}', 0)}
+                yield entries, payload
+                return
+            uris = ['{}/{}'.format(entries, n) for n in range(1, self.logEntries + 1)]
+            yield entries, self.collection(entries, 'LogEntryCollection', 'Log Entries', uris)
+            for n, euri in enumerate(uris, 1):
+                yield euri, self.log_entry(euri, str(n), n)
+
+    def log_entry(self, uri, ident, n):
+        return {'@odata.id': uri, '@odata.type': '#LogEntry.v1_4_0.LogEntry', 'Id': ident, 'Name': 'Log Entry {}'.format(ident),
+                'EntryType': 'Event', 'Severity': 'OK', 'Created': '2018-10-12T12:{:02d}:{:02d}Z'.format(n // 60 % 60, n % 60),
+                'Message': 'Event {} occurred'.format(ident), 'MessageId': 'Base.1.0.Success'}
+
+    def files(self, shortForm):
+        """
+        Generate (relative directory, file name, text) for every file of the mockup
+        """
+        if not shortForm:
+            yield 'redfish', 'index.json', json.dumps({'v1': '/redfish/v1/'})
+        # the optional files are the same for every resource, serialize them once
+        headersText = json.dumps({'GET': {'Content-Type': 'application/json', 'OData-Version': '4.0', 'Cache-Control': 'no-cache'}})
+        timesText = None
+        if self.times is not None:
+            timesText = json.dumps({m + '_Time': str(self.times) for m in ('GET', 'HEAD', 'PATCH', 'POST', 'DELETE')})
+        for uri, payload in self.resources():
+            rpath = uri.lstrip('/')
+            if shortForm:
+                rpath = rpath[len('redfish/v1/'):] if rpath.startswith('redfish/v1/') else ''
+            yield rpath, 'index.json', json.dumps(payload, indent=4)
+            if self.headers:
+                yield rpath, 'headers.json', headersText
+            if timesText is not None:
+                yield rpath, 'time.json', timesText
+
+    def write(self, mockDir, shortForm=False, writers=8):
+        """
+        Write the mockup into mockDir
+        :return: (number of files, seconds taken)
+        """
+        start = time.time()
+
+        def write_file(path, text):
+            with open(path, 'w') as f:
+                f.write(text)
+
+        count = 0
+        made = set()
+        with ThreadPoolExecutor(max_workers=writers) as pool:
+            pending = []
+            for rpath, filename, text in self.files(shortForm):
+                dirpath = os.path.join(mockDir, rpath)
+                if dirpath not in made:
+                    os.makedirs(dirpath, exist_ok=True)
+                    made.add(dirpath)
+                pending.append(pool.submit(write_file, os.path.join(dirpath, filename), text))
+                count += 1
+                # keep the number of files held in memory bounded
+                if len(pending) >= 4096:
+                    for p in pending:
+                        p.result()
+                    pending = []
+            for p in pending:
+                p.result()
+        return count, time.time() - start
+
+
+def usage(program):
+        print("usage: {}   -o <mockupDir> [-S][--systems=<n>][--depth=<n>]".format(program))
+        print("      -h --help                        # prints usage ")
+        print("      -o <dir>      --output=<dir>     # Directory to write the mockup to")
+        print("      -S            --shortForm        # Write a short form mockup (without /redfish/v1 directories)")
+        print("      --systems=<n>                    # Members of the Systems collection, default 100")
+        print("      --chassis=<n>                    # Members of the Chassis collection, default one per system")
+        print("      --managers=<n>                   # Members of the Managers collection, default 1")
+        print("      --processors=<n>                 # Processors of each system, default 2")
+        print("      --memory=<n>                     # Memory modules of each system, default 4")
+        print("      --logEntries=<n>                 # Log entries of each system, default 10")
+        print("      --depth=<n>                      # Levels below each system: 1 none, 2 Processors/Memory/LogServices,")
+        print("                                       # 3 also log entries, default 3")
+        print("      --virtualEntries                 # Let the server generate log entries from a Members@Mockup.Template")
+        print("      -X            --headers          # Write headers.json for every resource")
+        print("      -t <delay>    --time=<delay>     # Write time.json with this delay for every resource")
+        sys.stdout.flush()
+
+
+def main(argv):
+        program = argv[0]
+        output = None
+        shortForm = False
+        settings = dict()
+        try:
+            opts, args = getopt.getopt(argv[1:], "hSXo:t:", ["help", "shortForm", "headers", "output=", "time=", "systems=", "chassis=",
+                                                             "managers=", "processors=", "memory=", "logEntries=", "depth=", "virtualEntries"])
+        except getopt.GetoptError:
+            print("Error parsing options", file=sys.stderr)
+            usage(program)
+            sys.exit(2)
+
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage(program)
+                sys.exit(0)
+            elif opt in ("-o", "--output"):
+                output = arg
+            elif opt in ("-S", "--shortForm"):
+                shortForm = True
+            elif opt in ("-X", "--headers"):
+                settings['headers'] = True
+            elif opt in ("-t", "--time"):
+                settings['times'] = float(arg)
+            elif opt in ("--virtualEntries",):
+                settings['virtualEntries'] = True
+            else:
+                settings[opt.lstrip('-')] = int(arg)
+
+        if output is None:
+            print("ERROR: an output directory is required", file=sys.stderr)
+            usage(program)
+            sys.exit(2)
+
+        count, seconds = MockupGenerator(**settings).write(output, shortForm)
+        print("Wrote {} files to {} in {:.2f} seconds".format(count, os.path.realpath(output), seconds))
+
+
+# the below is only executed if the program is run as a script
+if __name__ == "__main__":
+        main(sys.argv)
@@ -0,0 +1,119 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+" Leveled and sampled logging of the mockup server, formatted and written by a background thread "
+
+import os
+import sys
+import queue
+import random
+import logging
+import logging.handlers
+
+levels = {'off': logging.CRITICAL + 10, 'error': logging.ERROR, 'warning': logging.WARNING,
+          'info': logging.INFO, 'debug': logging.DEBUG}
+
+logger = logging.getLogger('rfMockupServer')
+# one line per request, in the common log format followed by the seconds taken
+access_logger = logging.getLogger('rfMockupServer.access')
+
+
+class RfLogQueueHandler(logging.handlers.QueueHandler):
+    '''
+    hands records to the writer thread as they are, message formatting is left to that thread
+    '''
+    def __init__(self, log):
+        logging.handlers.QueueHandler.__init__(self, log.queue)
+        self.log = log
+
+    def prepare(self, record):
+        if record.exc_info:
+            # tracebacks can't wait, the frames they refer to change
+            return logging.handlers.QueueHandler.prepare(self, record)
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.log.dropped += 1
+
+
+class RfLogWriter(logging.StreamHandler):
+    '''
+    writes records on the listener thread and flushes only once the queue is drained
+    '''
+    def __init__(self, stream, pending):
+        logging.StreamHandler.__init__(self, stream)
+        self.pending = pending
+
+    def emit(self, record):
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+            if self.pending.empty():
+                self.flush()
+        except Exception:
+            self.handleError(record)
+
+
+class RfMockupLog():
+    def __init__(self, level='debug', path=None, sample=1.0, queueSize=10000):
+        """__init__
+
+        Initialize the logging settings; nothing is set up until start
+
+        :param level: one of off, error, warning, info (adds the access log), debug (adds request headers and payloads)
+        :param path: file to append to, default stdout
+        :param sample: fraction of requests whose access and debug lines are logged, warnings and errors always are
+        :param queueSize: records allowed to wait for the writer thread, further records are dropped
+        """
+        self.level = levels[level]
+        self.path = path
+        self.sample = sample
+        self.queueSize = queueSize
+        self.dropped = 0
+        self.queue = None
+        self.listener = None
+        self.writer = None
+        self.pid = None
+
+    def start(self):
+        """
+        Route the server's loggers through a writer thread; call again in a forked process to get its own thread
+        """
+        if self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        self.queue = queue.Queue(self.queueSize)
+        self.dropped = 0
+        stream = open(self.path, 'a') if self.path is not None else sys.stdout
+        self.writer = RfLogWriter(stream, self.queue)
+        self.writer.setFormatter(logging.Formatter('%(message)s'))
+        logger.handlers = [RfLogQueueHandler(self)]
+        logger.propagate = False
+        logger.setLevel(self.level)
+        self.listener = logging.handlers.QueueListener(self.queue, self.writer)
+        self.listener.start()
+
+    def sampled(self):
+        """
+        True if the access and debug lines of the next request are logged
+        """
+        if self.level > logging.INFO:
+            return False
+        return self.sample >= 1 or random.random() < self.sample
+
+    def counters(self):
+        return {'dropped': self.dropped, 'queued': self.queue.qsize() if self.queue is not None else 0}
+
+    def stop(self):
+        """
+        Write out the queued records and stop the writer thread
+        """
+        if self.listener is not None and self.pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self.writer.flush()
+            if self.path is not None:
+                self.writer.close()
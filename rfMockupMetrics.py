@@ -0,0 +1,176 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+" Request timings and counters of the mockup server, rendered as json or Prometheus text "
+
+import os
+import time
+import bisect
+import threading
+
+# upper bounds in seconds of the histogram buckets, the last bucket is +Inf
+default_buckets = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# order the phases of a request are reported in
+phase_names = ('resolve', 'lookup', 'merge', 'expand', 'serialize', 'compress', 'write', 'delay')
+
+
+class RfHistogram():
+    def __init__(self, buckets=default_buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self):
+        """
+        (upper bound, observations at or below it) pairs, ending with '+Inf'
+        """
+        total = 0
+        out = []
+        for bound, n in zip(list(self.buckets) + ['+Inf'], self.counts):
+            total += n
+            out.append((bound, total))
+        return out
+
+    def as_dict(self):
+        return {'count': self.count, 'seconds': round(self.sum, 6),
+                'buckets': {str(bound): n for bound, n in self.cumulative()}}
+
+
+class RfMockupMetrics():
+    def __init__(self, maxUris=1000):
+        """__init__
+
+        Initialize empty metrics of one server process
+
+        :param maxUris: distinct URIs counted separately, requests to further URIs are counted under '(other)'
+        """
+        self.maxUris = maxUris
+        self.lock = threading.Lock()
+        self.started = time.time()
+        self.methods = dict()       # method: RfHistogram of request seconds
+        self.statuses = dict()      # (method, status): requests
+        self.uris = dict()          # uri: {method: [requests, seconds, errors]}
+        self.phases = dict()        # phase: RfHistogram of seconds spent in it
+        self.counts = dict()        # named event counters, e.g. cache hits
+
+    def record(self, method, uri, status, seconds, phases):
+        """
+        Add one finished request
+
+        :param method: request method
+        :param uri: request path without the query
+        :param status: response status code
+        :param seconds: time from parsing the request to sending the response
+        :param phases: {phase: seconds} spent in each phase of the request
+        """
+        with self.lock:
+            if method not in self.methods:
+                self.methods[method] = RfHistogram()
+            self.methods[method].observe(seconds)
+            key = (method, status)
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+
+            if uri not in self.uris and len(self.uris) >= self.maxUris:
+                uri = '(other)'
+            perMethod = self.uris.setdefault(uri, dict())
+            counts = perMethod.setdefault(method, [0, 0.0, 0])
+            counts[0] += 1
+            counts[1] += seconds
+            if status >= 400:
+                counts[2] += 1
+
+            for phase, spent in phases.items():
+                if phase not in self.phases:
+                    self.phases[phase] = RfHistogram()
+                self.phases[phase].observe(spent)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def snapshot(self, extra=None):
+        """
+        Metrics as a json-ready dict
+
+        :param extra: {section: {name: value}} counters of other parts of the server, e.g. event delivery
+        """
+        with self.lock:
+            statuses = dict()
+            for (method, status), n in self.statuses.items():
+                statuses.setdefault(method, dict())[str(status)] = n
+            out = {'pid': os.getpid(),
+                   'uptime_sec': round(time.time() - self.started, 3),
+                   'requests': {method: dict(h.as_dict(), statuses=statuses.get(method, {}))
+                                for method, h in sorted(self.methods.items())},
+                   'uris': {uri: {method: {'count': c[0], 'seconds': round(c[1], 6), 'errors': c[2]}
+                                  for method, c in sorted(perMethod.items())}
+                            for uri, perMethod in sorted(self.uris.items())},
+                   'phases': {phase: self.phases[phase].as_dict() for phase in self.ordered_phases()},
+                   'counters': dict(self.counts)}
+        out.update(extra or {})
+        return out
+
+    def ordered_phases(self):
+        known = [p for p in phase_names if p in self.phases]
+        return known + sorted(p for p in self.phases if p not in phase_names)
+
+    def prometheus(self, extra=None):
+        """
+        Metrics in the Prometheus text exposition format
+
+        :param extra: {section: {name: value}} counters, exported as rfmockup_<section>{name="..."}
+        """
+        lines = []
+
+        def histogram(name, help, label, histograms):
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} histogram'.format(name))
+            for value, h in histograms:
+                for bound, n in h.cumulative():
+                    lines.append('{}_bucket{{{}="{}",le="{}"}} {}'.format(name, label, value, bound, n))
+                lines.append('{}_sum{{{}="{}"}} {}'.format(name, label, value, repr(h.sum)))
+                lines.append('{}_count{{{}="{}"}} {}'.format(name, label, value, h.count))
+
+        with self.lock:
+            lines.append('# HELP rfmockup_requests_total Requests answered, by method and status')
+            lines.append('# TYPE rfmockup_requests_total counter')
+            for (method, status), n in sorted(self.statuses.items()):
+                lines.append('rfmockup_requests_total{{method="{}",status="{}"}} {}'.format(method, status, n))
+            histogram('rfmockup_request_duration_seconds', 'Time from parsing a request to sending its response',
+                      'method', sorted(self.methods.items()))
+            histogram('rfmockup_phase_duration_seconds', 'Time spent in each phase of a request',
+                      'phase', [(p, self.phases[p]) for p in self.ordered_phases()])
+
+            lines.append('# HELP rfmockup_uri_requests_total Requests by URI and method')
+            lines.append('# TYPE rfmockup_uri_requests_total counter')
+            for uri, perMethod in sorted(self.uris.items()):
+                for method, c in sorted(perMethod.items()):
+                    lines.append('rfmockup_uri_requests_total{{uri="{}",method="{}"}} {}'.format(escape(uri), method, c[0]))
+            lines.append('# HELP rfmockup_uri_request_seconds_total Time spent answering requests by URI and method')
+            lines.append('# TYPE rfmockup_uri_request_seconds_total counter')
+            for uri, perMethod in sorted(self.uris.items()):
+                for method, c in sorted(perMethod.items()):
+                    lines.append('rfmockup_uri_request_seconds_total{{uri="{}",method="{}"}} {}'.format(escape(uri), method, repr(c[1])))
+
+            for name, n in sorted(self.counts.items()):
+                lines.append('# TYPE rfmockup_{}_total counter'.format(name))
+                lines.append('rfmockup_{}_total {}'.format(name, n))
+
+        for section, counters in sorted((extra or {}).items()):
+            lines.append('# TYPE rfmockup_{} gauge'.format(section))
+            for name, n in sorted(counters.items()):
+                lines.append('rfmockup_{}{{name="{}"}} {}'.format(section, name, n))
+        lines.append('rfmockup_uptime_seconds {}'.format(round(time.time() - self.started, 3)))
+        return '\n'.join(lines) + '\n'
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
@@ -0,0 +1,187 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+# rfMockupPack.py
+# packs a mockup directory into one file that redfishMockupServer.py -D serves through a memory map
+
+import sys
+import os
+import getopt
+import json
+import mmap
+import struct
+import time
+
+# magic, format version, flags, offset and length of the table
+pack_header = struct.Struct('<8sIIQQ')
+pack_magic = b'RFMOCKPK'
+pack_version = 1
+
+
+def serialize_body(body):
+    """
+    GET response body of an index.json as the server writes it when nothing has changed the resource,
+    None where the server builds it differently (generated members, not a json object)
+    """
+    if not isinstance(body, dict) or 'Members@Mockup.Template' in body:
+        return None
+    body = dict(body)
+    body.pop("@Redfish.Copyright", None)
+    return json.dumps(body, sort_keys=True, indent=4, separators=(",", ": ")).encode()
+
+
+def pack_mockup(mockDir, packPath):
+    """
+    Write every file of mockDir into packPath: the files as they are, the GET response body of each
+    index.json serialized once more, and a table of their offsets
+    :return: (number of files, seconds taken)
+    """
+    start = time.time()
+    files = dict()      # name: [offset, length, mtime in ns]
+    bodies = dict()     # resource path: [offset, length]
+    with open(packPath + '.tmp', 'wb') as out:
+        out.write(pack_header.pack(pack_magic, pack_version, 0, 0, 0))
+        for dirpath, dirnames, filenames in os.walk(mockDir):
+            dirnames.sort()
+            rpath = os.path.relpath(dirpath, mockDir).replace(os.sep, '/')
+            rpath = '' if rpath == '.' else rpath
+            for filename in sorted(filenames):
+                path = os.path.join(dirpath, filename)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                name = rpath + '/' + filename if rpath else filename
+                files[name] = [out.tell(), len(data), os.stat(path).st_mtime_ns]
+                out.write(data)
+                if filename == 'index.json':
+                    try:
+                        body = serialize_body(json.loads(data.decode('utf-8')))
+                    except ValueError as e:
+                        print("WARNING: invalid json file {}: {}".format(path, e), file=sys.stderr)
+                        body = None
+                    if body is not None:
+                        bodies[rpath] = [out.tell(), len(body)]
+                        out.write(body)
+        table = json.dumps({'Files': files, 'Bodies': bodies}, separators=(',', ':')).encode()
+        offset = out.tell()
+        out.write(table)
+        out.seek(0)
+        out.write(pack_header.pack(pack_magic, pack_version, 0, offset, len(table)))
+    os.replace(packPath + '.tmp', packPath)
+    return len(files), time.time() - start
+
+
+def is_packed_mockup(path):
+    """
+    True if path is a file written by pack_mockup
+    """
+    if not os.path.isfile(path):
+        return False
+    with open(path, 'rb') as f:
+        return f.read(len(pack_magic)) == pack_magic
+
+
+class RfPackedMockup():
+    def __init__(self, path):
+        """__init__
+
+        Open a packed mockup; its files are read from a read-only memory map, which server processes
+        share through the page cache
+
+        :param path: file written by pack_mockup
+        :raises ValueError: if it is not a packed mockup of this format version
+        """
+        self.path = path
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, flags, offset, length = pack_header.unpack_from(self.map, 0)
+        if magic != pack_magic or version != pack_version:
+            raise ValueError('{} is not a packed mockup of version {}'.format(path, pack_version))
+        table = json.loads(self.map[offset:offset + length].decode('utf-8'))
+        self.files = table['Files']
+        self.bodies = table['Bodies']
+        self.dirs = {''}
+        for name in self.files:
+            while '/' in name:
+                name = name.rpartition('/')[0]
+                if name in self.dirs:
+                    break
+                self.dirs.add(name)
+
+    def isfile(self, name):
+        return name in self.files
+
+    def isdir(self, name):
+        return name in self.dirs
+
+    def entry(self, name):
+        """
+        (offset in the pack, length, mtime in ns) of the file name, None if there is none
+        """
+        return self.files.get(name)
+
+    def read(self, name):
+        """
+        Content of the file name, relative to the mockup directory with / separators, None if there is none
+        """
+        entry = self.files.get(name)
+        return self.map[entry[0]:entry[0] + entry[1]] if entry is not None else None
+
+    def body(self, rpath):
+        """
+        Serialized GET response body of the index.json of rpath, see serialize_body, None if there is none
+        """
+        entry = self.bodies.get(rpath)
+        return self.map[entry[0]:entry[0] + entry[1]] if entry is not None else None
+
+    def names(self):
+        return self.files.keys()
+
+    def close(self):
+        self.map.close()
+
+
+def usage(program):
+        print("usage: {}   -D <mockupDir> -o <packFile>".format(program))
+        print("      -h --help                        # prints usage ")
+        print("      -D <dir>      --Dir=<dir>        # Mockup directory to pack, tall or short form")
+        print("      -o <file>     --output=<file>    # File to write, served with redfishMockupServer.py -D <file>")
+        sys.stdout.flush()
+
+
+def main(argv):
+        program = argv[0]
+        mockDir = None
+        output = None
+        try:
+            opts, args = getopt.getopt(argv[1:], "hD:o:", ["help", "Dir=", "output="])
+        except getopt.GetoptError:
+            print("Error parsing options", file=sys.stderr)
+            usage(program)
+            sys.exit(2)
+
+        for opt, arg in opts:
+            if opt in ("-h", "--help"):
+                usage(program)
+                sys.exit(0)
+            elif opt in ("-D", "--Dir"):
+                mockDir = arg
+            elif opt in ("-o", "--output"):
+                output = arg
+
+        if mockDir is None or output is None:
+            print("ERROR: a mockup directory and an output file are required", file=sys.stderr)
+            usage(program)
+            sys.exit(2)
+        if not os.path.isdir(mockDir):
+            print("ERROR: {} is not a directory".format(mockDir), file=sys.stderr)
+            sys.exit(1)
+
+        count, seconds = pack_mockup(mockDir, output)
+        print("Packed {} files into {} ({:.1f} MB) in {:.2f} seconds".format(
+            count, os.path.realpath(output), os.path.getsize(output) / 1048576.0, seconds))
+
+
+# the below is only executed if the program is run as a script
+if __name__ == "__main__":
+        main(sys.argv)
@@ -0,0 +1,197 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+" OData $filter and $select of GET requests "
+
+import re
+
+# properties a $select keeps whether they are asked for or not
+select_always = ('@odata.id', '@odata.type', '@odata.context', '@odata.etag')
+
+token_pattern = re.compile(r"""\s*(?:(?P<open>\()|(?P<close>\))|(?P<string>'(?:[^']|'')*')|
+                               (?P<number>-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?)(?![\w@#./])|
+                               (?P<name>[A-Za-z_@#][\w@#./]*))""", re.VERBOSE)
+
+comparisons = {
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'ge': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'le': lambda a, b: a <= b,
+}
+
+literals = {'true': True, 'false': False, 'null': None}
+
+
+class RfQueryError(Exception):
+    pass
+
+
+def property_path(text):
+    """
+    Property path of a $filter or $select term, e.g. 'Status/Health' is ('Status', 'Health')
+    """
+    path = tuple(text.split('/'))
+    if not all(path):
+        raise RfQueryError('invalid property {}'.format(text))
+    return path
+
+
+def lookup(payload, path):
+    """
+    Value at a property path of a payload, None if it has none
+    """
+    for name in path:
+        if not isinstance(payload, dict):
+            return None
+        payload = payload.get(name)
+    return payload
+
+
+class RfFilter():
+    def __init__(self, text):
+        """__init__
+
+        Parse a $filter expression: comparisons of properties with literals by eq, ne, gt, ge, lt
+        and le, combined by and, or, not and parentheses
+
+        :param text: e.g. "PowerState eq 'On' and Status/Health ne 'OK'"
+        :raises RfQueryError: if it is not a supported expression
+        """
+        self.text = text
+        self.properties = set()     # property paths the expression looks at
+        self.tokens = self.tokenize(text)
+        self.pos = 0
+        self.test = self.parse_or()
+        if self.pos != len(self.tokens):
+            raise RfQueryError('unexpected {} in $filter'.format(self.tokens[self.pos][1]))
+
+    def matches(self, get):
+        """
+        :param get: returns the value of a property path of the member, None if it has none
+        :return: True if the member passes the filter
+        """
+        return self.test(get)
+
+    @staticmethod
+    def tokenize(text):
+        tokens = []
+        pos = 0
+        text = text.rstrip()
+        while pos < len(text):
+            match = token_pattern.match(text, pos)
+            if match is None:
+                raise RfQueryError('invalid $filter at {!r}'.format(text[pos:pos + 20]))
+            tokens.append((match.lastgroup, match.group(match.lastgroup)))
+            pos = match.end()
+        return tokens
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self):
+        token = self.peek()
+        if token[0] is None:
+            raise RfQueryError('$filter ends too early')
+        self.pos += 1
+        return token
+
+    def parse_or(self):
+        test = self.parse_and()
+        while self.peek() == ('name', 'or'):
+            self.pos += 1
+            left, right = test, self.parse_and()
+            test = lambda get, left=left, right=right: left(get) or right(get)
+        return test
+
+    def parse_and(self):
+        test = self.parse_not()
+        while self.peek() == ('name', 'and'):
+            self.pos += 1
+            left, right = test, self.parse_not()
+            test = lambda get, left=left, right=right: left(get) and right(get)
+        return test
+
+    def parse_not(self):
+        if self.peek() == ('name', 'not'):
+            self.pos += 1
+            inner = self.parse_not()
+            return lambda get: not inner(get)
+        if self.peek()[0] == 'open':
+            self.pos += 1
+            test = self.parse_or()
+            if self.take()[0] != 'close':
+                raise RfQueryError('missing ) in $filter')
+            return test
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        left = self.parse_operand()
+        kind, op = self.take()
+        if kind != 'name' or op not in comparisons:
+            raise RfQueryError('expected a comparison operator in $filter, not {}'.format(op))
+        right = self.parse_operand()
+        compare = comparisons[op]
+
+        def test(get):
+            a, b = left(get), right(get)
+            if op not in ('eq', 'ne') and (a is None or b is None or isinstance(a, str) != isinstance(b, str)):
+                # ordering only applies to two strings or two numbers
+                return False
+            try:
+                return compare(a, b)
+            except TypeError:
+                return False
+        return test
+
+    def parse_operand(self):
+        kind, text = self.take()
+        if kind == 'string':
+            value = text[1:-1].replace("''", "'")
+            return lambda get: value
+        if kind == 'number':
+            value = float(text) if any(c in text for c in '.eE') else int(text)
+            return lambda get: value
+        if kind == 'name' and text in literals:
+            value = literals[text]
+            return lambda get: value
+        if kind == 'name':
+            path = property_path(text)
+            self.properties.add(path)
+            return lambda get: get(path)
+        raise RfQueryError('expected a property or a literal in $filter, not {}'.format(text))
+
+
+def parse_select(text):
+    """
+    Property paths of a $select, e.g. 'Name,Status/Health'
+    :raises RfQueryError: if a property is empty
+    """
+    return [property_path(term.strip()) for term in text.split(',')]
+
+
+def select_properties(payload, paths):
+    """
+    The part of a payload that $select keeps: the properties at paths, and the select_always ones
+    :return: a new dict, the values kept are shared with payload
+    """
+    out = {name: payload[name] for name in select_always if name in payload}
+    for path in paths:
+        source, target = payload, out
+        for name in path[:-1]:
+            source = source.get(name)
+            if not isinstance(source, dict):
+                break
+            current = target.get(name)
+            if current is source:
+                # the whole property is kept already
+                break
+            if current is None:
+                current = target[name] = dict()
+            target = current
+        else:
+            if path[-1] in source:
+                target[path[-1]] = source[path[-1]]
+    return out
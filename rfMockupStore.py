@@ -0,0 +1,229 @@
+# Copyright Notice:
+# Copyright 2016-2018 DMTF. All rights reserved.
+# License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/Redfish-Mockup-Server/blob/master/LICENSE.md
+
+" State changed by PATCH/POST/DELETE, kept in memory and optionally in an append-only journal "
+
+import os
+import json
+import threading
+from multiprocessing.managers import SyncManager
+
+
+class RfStoreFull(Exception):
+    pass
+
+
+class RfMutationStore():
+    def __init__(self, path=None, limit=None, root='', types=(), restore=None, edit=None, snapshotEvery=10000):
+        """__init__
+
+        Initialize an empty store; with a journal call open to replay it
+
+        :param path: journal file; the state is written to <path>.snapshot every snapshotEvery changes
+        :param limit: bytes of encoded state allowed, changes beyond it raise RfStoreFull
+        :param root: prefix of the keys left out of the journal, so that a moved mockup keeps its state
+        :param types: classes stored in values besides json types, each with to_state() and from_state(dict)
+        :param restore: called with the key and the value of each replayed change, returns the value to keep
+        :param edit: called with a value and an edit of it, see update, returns the edited value
+        :param snapshotEvery: journal records after which the journal is folded into the snapshot
+        """
+        self.path = path
+        self.limit = limit
+        self.root = root
+        self.types = {cls.__name__: cls for cls in types}
+        self.restore = restore
+        self.edit = edit
+        self.snapshotEvery = snapshotEvery
+        self.entries = dict()
+        self.sizes = dict()         # key: encoded size, kept when there is a journal or a limit
+        self.size = 0
+        self.lock = threading.RLock()
+        self.journal = None
+        self.records = 0            # journal records since the last snapshot
+        self.snapshots = 0
+        self.measured = path is not None or limit is not None
+
+    # reads do not take the lock, single dict operations are atomic
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __getitem__(self, key):
+        return self.entries[key]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key, default=None):
+        return self.entries.get(key, default)
+
+    def keys(self):
+        return list(self.entries.keys())
+
+    def __setitem__(self, key, value):
+        self.update({key: value})
+
+    def __delitem__(self, key):
+        self.update({}, (key,))
+
+    def update(self, changes, removed=(), edits=None):
+        """
+        Set the changes, drop the removed keys and apply the edits together, as one journal record
+
+        :param changes: {key: value}
+        :param removed: keys to drop, missing keys are ignored
+        :param edits: {key: edit}, json edits the edit function applies to the value of key once the changes are set;
+                      only the edit is journaled, not the whole value
+        :raises RfStoreFull: if the limit would be exceeded; nothing is changed then
+        """
+        edits = edits or {}
+        with self.lock:
+            if not self.measured:
+                self.entries.update(changes)
+                for key in removed:
+                    self.entries.pop(key, None)
+                for key, edit in edits.items():
+                    self.entries[key] = self.edit(self.entries.get(key), edit)
+                return
+            encoded = {key: self.encode(value) for key, value in changes.items()}
+            encodedEdits = {key: self.encode(edit) for key, edit in edits.items()}
+            size = self.size
+            for key in removed:
+                size -= self.sizes.get(key, 0)
+            for key, text in encoded.items():
+                size += len(text) - self.sizes.get(key, 0)
+            # an edited value is counted as its encoded state plus its edits, until the next restart
+            size += sum(len(text) for text in encodedEdits.values())
+            if self.limit is not None and size > self.limit and size > self.size:
+                raise RfStoreFull('state store limit of {} bytes reached'.format(self.limit))
+            if self.journal is not None:
+                self.journal.write('{"set":' + self.join(encoded) + ',"del":' +
+                                   json.dumps([self.relative(key) for key in removed]) +
+                                   (',"edit":' + self.join(encodedEdits) if edits else '') + '}\n')
+                self.journal.flush()
+                self.records += 1
+            for key in removed:
+                self.entries.pop(key, None)
+                self.sizes.pop(key, None)
+            for key, value in changes.items():
+                self.entries[key] = value
+                self.sizes[key] = len(encoded[key])
+            for key, edit in edits.items():
+                self.entries[key] = self.edit(self.entries.get(key), edit)
+                self.sizes[key] = self.sizes.get(key, 0) + len(encodedEdits[key])
+            self.size = size
+            if self.journal is not None and self.records >= self.snapshotEvery:
+                self.snapshot()
+
+    def reset(self):
+        """
+        Drop all state, the mockup is served as it is on disk again
+        """
+        with self.lock:
+            self.entries.clear()
+            self.sizes.clear()
+            self.size = 0
+            if self.journal is not None:
+                self.snapshot()
+
+    def counters(self):
+        return {'entries': len(self.entries), 'bytes': self.size if self.measured else None,
+                'limit': self.limit, 'journal_records': self.records, 'snapshots': self.snapshots}
+
+    def relative(self, key):
+        return key[len(self.root):] if self.root and key.startswith(self.root) else key
+
+    def join(self, encoded):
+        # json object text from already encoded values
+        return '{' + ','.join(json.dumps(self.relative(key)) + ':' + text for key, text in encoded.items()) + '}'
+
+    def encode(self, value):
+        return json.dumps(value, separators=(',', ':'), default=self.encode_type)
+
+    def encode_type(self, value):
+        name = type(value).__name__
+        if name not in self.types:
+            raise TypeError('{} can not be stored'.format(name))
+        return {'@Mockup.Type': name, 'State': value.to_state()}
+
+    def decode_type(self, obj):
+        if '@Mockup.Type' in obj and obj['@Mockup.Type'] in self.types:
+            return self.types[obj['@Mockup.Type']].from_state(obj['State'])
+        return obj
+
+    def load_value(self, key, value):
+        if self.restore is not None:
+            value = self.restore(self.root + key, value)
+        self.entries[self.root + key] = value
+        self.sizes[self.root + key] = len(self.encode(value))
+
+    def open(self):
+        """
+        Replay the snapshot and the journal, then append further changes to the journal
+        :return: number of journal records replayed after the snapshot
+        """
+        with self.lock:
+            snapshotPath = self.path + '.snapshot'
+            if os.path.isfile(snapshotPath):
+                with open(snapshotPath) as f:
+                    for key, value in json.load(f, object_hook=self.decode_type).items():
+                        self.load_value(key, value)
+            replayed = 0
+            if os.path.isfile(self.path):
+                with open(self.path) as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line, object_hook=self.decode_type)
+                        except ValueError:
+                            # the last record of a crashed server may be cut short
+                            break
+                        for key in record.get('del', []):
+                            self.entries.pop(self.root + key, None)
+                            self.sizes.pop(self.root + key, None)
+                        for key, value in record.get('set', {}).items():
+                            self.load_value(key, value)
+                        for key, edit in record.get('edit', {}).items():
+                            self.entries[self.root + key] = self.edit(self.entries.get(self.root + key), edit)
+                            self.sizes[self.root + key] = self.sizes.get(self.root + key, 0) + len(self.encode(edit))
+                        replayed += 1
+            self.size = sum(self.sizes.values())
+            self.records = replayed
+            self.journal = open(self.path, 'a')
+            return replayed
+
+    def snapshot(self):
+        """
+        Write the whole state to the snapshot file and start an empty journal
+        """
+        with self.lock:
+            snapshotPath = self.path + '.snapshot'
+            with open(snapshotPath + '.tmp', 'w') as f:
+                f.write(self.join({key: self.encode(value) for key, value in self.entries.items()}))
+            os.replace(snapshotPath + '.tmp', snapshotPath)
+            self.journal.close()
+            self.journal = open(self.path, 'w')
+            self.records = 0
+            self.snapshots += 1
+
+    def close(self):
+        """
+        Fold the journal into the snapshot, so the next start only reads the snapshot
+        """
+        with self.lock:
+            if self.journal is not None:
+                if self.records:
+                    self.snapshot()
+                self.journal.close()
+                self.journal = None
+
+
+class RfStoreManager(SyncManager):
+    '''
+    manager process holding one RfMutationStore, and the lock around it, for forked server processes
+    '''
+    pass
+
+
+RfStoreManager.register('RfMutationStore', RfMutationStore,
+                        exposed=('__contains__', '__getitem__', '__len__', '__setitem__', '__delitem__', 'get', 'keys',
+                                 'update', 'reset', 'counters', 'open', 'close'))
@@ -2,19 +2,35 @@
 # Copyright 2016-2018 DMTF. All rights reserved.
 # License: BSD 3-Clause License. For full text see link: https://github.com/DMTF/python-redfish-library/blob/master/LICENSE.md
 
-" Lib to receive ssdp packets "
+" Lib to answer ssdp M-SEARCH requests and advertise Redfish services with NOTIFY "
 
-import socket
+import re
 import sys
+import time
+import socket
+import logging
+import selectors
+import threading
 
 # based on https://github.com/ZeWaren/python-upnp-ssdp-example/blob/master/lib/ssdp.py
 
+logger = logging.getLogger('rfMockupServer.ssdp')
+
+ssdp_group = '239.255.255.250'
+
+# the ST header of an M-SEARCH, whatever its case and line endings
+search_target = re.compile(rb'^ST[ \t]*:[ \t]*([^\r\n]*?)[ \t]*\r?$', re.IGNORECASE | re.MULTILINE)
+
+# sources remembered for rate limiting before the idle ones are forgotten
+max_sources = 10000
+
 
 class RfSDDPServer():
     def addSearchTarget(self, target):
         self.searchtargets.append(target)
+        self.build_replies()
 
-    def __init__(self, root, location, ip=None, port=1900, timeout=5):
+    def __init__(self, root, location, ip=None, port=1900, timeout=5, rate=10, notifyInterval=None, interfaces=None):
         """__init__
 
         Initialize an SDDP server
@@ -24,19 +40,28 @@ class RfSDDPServer():
         :param ip: address to bind to (IPV4 only?)
         :param port: port for server to exist on, default port 1900
         :param timeout: int for packet timeout
+        :param rate: M-SEARCH requests answered per second to each source address, in bursts of up to twice as many
+        :param notifyInterval: seconds between ssdp:alive advertisements, default half the max-age, 0 for none
+        :param interfaces: addresses of the interfaces to listen and advertise on, default [ip]
         """
         ip = ip if ip is not None else "0.0.0.0"
         self.searchtargets = ['ssdp:all', 'upnp:rootdevice', 'urn:dmtf-org:service:redfish-rest:1']
         self.ip, self.port = ip, port
         self.timeout = timeout
+        self.rate = rate
+        self.cachecontrol = 1800
+        self.notifyInterval = notifyInterval if notifyInterval is not None else self.cachecontrol // 2
+        self.interfaces = interfaces or [ip]
+        self.services = []
+        self.replies = dict()       # search target: reply datagrams, one per service
+        self.sources = dict()       # source address: [tokens, time of the last request]
+        self.counts = {'received': 0, 'answered': 0, 'limited': 0, 'notified': 0}
+        self.stopping = False
+        self.started = False
+        self.stopped = threading.Event()
 
         # setup payload info
-        self.location = location
-        self.UUID = root.get('UUID', 'nouuid')
-        self.cachecontrol = 1800
-        myVersion = root.get('RedfishVersion', '1.0.0')
-        self.major, self.minor, self.errata = tuple(myVersion.split('.'))
-        self.addSearchTarget('urn:dmtf-org:service:redfish-rest:1:{}'.format(self.minor))
+        self.addService(root, location)
 
         # initiate multicast socket
         # rf-spec:
@@ -46,12 +71,13 @@ class RfSDDPServer():
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)  # ttl 2
-        addr = socket.inet_aton('239.255.255.250')  # multicast address
-        interface = socket.inet_aton(self.ip)
+        addr = socket.inet_aton(ssdp_group)  # multicast address
         cmd = socket.IP_ADD_MEMBERSHIP
-        sock.setsockopt(socket.IPPROTO_IP, cmd, addr + interface)
-        sock.bind((self.ip, self.port))
-        sock.settimeout(timeout)
+        for interface in self.interfaces:
+            sock.setsockopt(socket.IPPROTO_IP, cmd, addr + socket.inet_aton(interface))
+        # listening on ip only keeps the socket to its address, other interfaces share a socket bound to all
+        sock.bind((self.ip if self.interfaces == [self.ip] else '', self.port))
+        sock.setblocking(False)
         """
         Redfish Service Search Target (ST): "urn:dmtf-org:service:redfish-rest:1"
         For ssdp, "ssdp:all".
@@ -59,49 +85,168 @@ class RfSDDPServer():
         queries searching for Search Target (ST) of "upnp:rootdevice"
         """
         self.sock = sock
-        print('SDDP Server Created')
+        # stop writes to waker to end the select of start at once
+        self.waker, self.wakee = socket.socketpair()
+        self.wakee.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.selector.register(self.wakee, selectors.EVENT_READ)
+        logger.info('SDDP Server Created')
+
+    def addService(self, root, location):
+        """
+        Answer for one more Redfish service, e.g. another emulated BMC of the same server
+
+        :param root: /redfish/v1 payload of the service
+        :param location: http location of its service root
+        """
+        myVersion = root.get('RedfishVersion', '1.0.0')
+        major, minor, errata = tuple(myVersion.split('.'))
+        self.services.append({'UUID': root.get('UUID', 'nouuid'), 'minor': minor, 'location': location})
+        if len(self.services) == 1:
+            # the attributes of the first service, as before there could be more
+            self.location = location
+            self.UUID = self.services[0]['UUID']
+            self.major, self.minor, self.errata = major, minor, errata
+        self.build_replies()
+
+    def build_replies(self):
+        """
+        Encode the M-SEARCH reply of every service once, keyed by the search targets it answers
+        """
+        replies = dict()
+        for service in self.services:
+            response = ['HTTP/1.1 200 OK',
+                        'CACHE-CONTROL: max-age={}'.format(self.cachecontrol),
+                        'ST:urn:dmtf-org:service:redfish-rest:1:{}'.format(service['minor']),
+                        'USN:uuid:{}::urn:dmtf-org:service:redfish-rest:1:{}'.format(service['UUID'], service['minor']),
+                        'AL:{}'.format(service['location']),
+                        'EXT:']
+            response.extend(('', ''))
+            response = '\r\n'.join(response).encode()
+            targets = self.searchtargets + ['urn:dmtf-org:service:redfish-rest:1:{}'.format(service['minor'])]
+            for target in set(targets):
+                replies.setdefault(target.encode(), []).append(response)
+        self.replies = replies
+
+    def notification(self, service, nts):
+        lines = ['NOTIFY * HTTP/1.1',
+                 'HOST: {}:{}'.format(ssdp_group, self.port),
+                 'NT: urn:dmtf-org:service:redfish-rest:1',
+                 'NTS: {}'.format(nts),
+                 'USN: uuid:{}::urn:dmtf-org:service:redfish-rest:1'.format(service['UUID'])]
+        if nts == 'ssdp:alive':
+            lines.extend(('CACHE-CONTROL: max-age={}'.format(self.cachecontrol), 'AL: {}'.format(service['location'])))
+        lines.extend(('', ''))
+        return '\r\n'.join(lines).encode()
+
+    def notify(self, nts):
+        """
+        Multicast a NOTIFY of every service on every interface
+
+        :param nts: ssdp:alive or ssdp:byebye
+        """
+        messages = [self.notification(service, nts) for service in self.services]
+        for interface in self.interfaces:
+            try:
+                self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(interface))
+                for message in messages:
+                    self.sock.sendto(message, (ssdp_group, self.port))
+                    self.counts['notified'] += 1
+            except OSError as e:
+                logger.warning('SSDP %s on %s failed: %s', nts, interface, e)
 
     def start(self):
-        print('SDDP Server Running...')
-        countTimeout = pcount = 0
-        while True:
+        """
+        Answer M-SEARCH requests and advertise until stop; the socket is used from this thread only,
+        ssdp:byebye is sent here too once the loop ends
+        """
+        logger.info('SDDP Server Running for %d services', len(self.services))
+        self.started = True
+        try:
+            if self.notifyInterval:
+                self.notify('ssdp:alive')
+            nextNotify = time.monotonic() + self.notifyInterval
+            while not self.stopping:
+                timeout = self.timeout
+                if self.notifyInterval:
+                    timeout = max(0, min(timeout, nextNotify - time.monotonic()))
+                try:
+                    for key, events in self.selector.select(timeout):
+                        if key.fileobj is self.sock:
+                            self.receive()
+                    if self.notifyInterval and time.monotonic() >= nextNotify and not self.stopping:
+                        self.notify('ssdp:alive')
+                        nextNotify = time.monotonic() + self.notifyInterval
+                except Exception:
+                    logger.exception('SSDP error')
+        finally:
+            if self.notifyInterval:
+                self.notify('ssdp:byebye')
+            self.selector.close()
+            self.sock.close()
+            self.waker.close()
+            self.wakee.close()
+            self.stopped.set()
+
+    def receive(self):
+        # take what is queued, without waiting for more
+        for _ in range(64):
             try:
-                if countTimeout % 5 == 0:
-                    print('Ssdp Poll... {} pings'.format(pcount))
-                    pcount = 0
-                    countTimeout = 1
                 data, addr = self.sock.recvfrom(1024)
-                pcount += 1
-                self.check(data, addr)
-            except socket.timeout:
-                countTimeout += 1
-                continue
-            except Exception as e:
-                print('error occurred ' + str(e))
-                pass
-        pass
+            except (BlockingIOError, InterruptedError):
+                return
+            self.counts['received'] += 1
+            self.check(data, addr)
 
-    def check(self, data, addr):
-        print('SSDP Packet received from {}'.format(addr))
-        decoded = data.decode().replace('\r', '').split('\n')
-        msgtype, decoded = decoded[0], decoded[1:]
-        decodeddict = {x.split(':',  1)[0].upper(): x.split(':', 1)[1].strip(' ') for x in decoded if x != ''}
+    def allow(self, source):
+        """
+        Take a token of the source's bucket, False if it is empty
+        """
+        now = time.monotonic()
+        bucket = self.sources.get(source)
+        if bucket is None:
+            if len(self.sources) >= max_sources:
+                # a bucket is full again two seconds after its last request
+                self.sources = {s: b for s, b in self.sources.items() if now - b[1] < 2}
+            bucket = self.sources[source] = [2.0 * self.rate, now]
+        bucket[0] = min(2.0 * self.rate, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if bucket[0] < 1:
+            return False
+        bucket[0] -= 1
+        return True
 
-        if 'M-SEARCH' in msgtype:
-            st = decodeddict.get('ST')
-            if st in self.searchtargets:
-                response = ['HTTP/1.1 200 OK',
-                            'CACHE-CONTROL: max-age={}'.format(self.cachecontrol),
-                            'ST:urn:dmtf-org:service:redfish-rest:1:{}'.format(self.minor),
-                            'USN:uuid:{}::urn:dmtf-org:service:redfish-rest:1:{}'.format(self.UUID, self.minor),
-                            'AL:{}'.format(self.location),
-                            'EXT:']
+    def check(self, data, addr):
+        if not data.startswith(b'M-SEARCH'):
+            return
+        match = search_target.search(data)
+        replies = self.replies.get(match.group(1)) if match is not None else None
+        if not replies:
+            return
+        if self.rate and not self.allow(addr[0]):
+            self.counts['limited'] += 1
+            logger.debug('SSDP M-SEARCH from %s over the rate limit', addr)
+            return
+        for response in replies:
+            self.sock.sendto(response, addr)
+        self.counts['answered'] += 1
+        logger.debug('SSDP Packet sent to %s', addr)
 
-                response.extend(('', ''))
-                response = '\r\n'.join(response)
+    def counters(self):
+        return dict(self.counts)
 
-                self.sock.sendto(response.encode(), addr)
-                print('SSDP Packet sent to {}'.format(addr))
+    def stop(self):
+        """
+        End start, which says ssdp:byebye for every service, and wait for it
+        """
+        self.stopping = True
+        if self.started and not self.stopped.is_set():
+            try:
+                self.waker.send(b'\0')
+            except OSError:
+                pass
+            self.stopped.wait(self.timeout + 1)
 
 
 """
@@ -121,13 +266,14 @@ def main(argv=None):
     """
     hostname = "127.0.0.1"
     location = "http://127.0.0.1"
+    logging.basicConfig(level=logging.DEBUG, format='%(message)s')
 
     server = RfSDDPServer({}, '{}:{}{}'.format(location, '8000', '/redfish/v1'), hostname)
 
     try:
         server.start()
     except KeyboardInterrupt:
-        pass
+        server.stop()
 
     # on exit will auto close sockets
     print("Shutting down Ssdp server")